@@ -0,0 +1,37 @@
+"""Foreign key indexes
+
+Revision ID: 03fea5d11f5b
+Revises: e9d126ccdaa8
+Create Date: 2026-10-18 11:02:17.540931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '03fea5d11f5b'
+down_revision: Union[str, None] = 'e9d126ccdaa8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_orders_customer_id_id', 'orders', ['customer_id', 'id']),
+    ('ix_orders_product_id_id', 'orders', ['product_id', 'id']),
+    ('ix_products_category_id_id', 'products', ['category_id', 'id']),
+]
+
+
+# Индексы строятся с CONCURRENTLY (вне транзакции), чтобы не блокировать запись в orders на больших таблицах
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
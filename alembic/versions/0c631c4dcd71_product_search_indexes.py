@@ -0,0 +1,34 @@
+"""Product search indexes
+
+Revision ID: 0c631c4dcd71
+Revises: 03fea5d11f5b
+Create Date: 2026-10-18 11:48:05.227713
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c631c4dcd71'
+down_revision: Union[str, None] = '03fea5d11f5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        # Выражение должно совпадать с models.product_search_document, иначе индекс не будет использоваться
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_search ON products USING gin "
+                   "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_name_trgm ON products USING gin "
+                   "(name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_products_name_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_products_search")
@@ -0,0 +1,39 @@
+"""Product stock
+
+Revision ID: 5b8e0f6c2d47
+Revises: 7ea89dbe8f23
+Create Date: 2026-10-18 14:22:08.514390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e0f6c2d47'
+down_revision: Union[str, None] = '7ea89dbe8f23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# У существующих товаров остаток пустой (не учитывается), поэтому заказы на них создаются как раньше
+def upgrade() -> None:
+    op.add_column('products', sa.Column('stock', sa.Integer(), nullable=True))
+    op.add_column('products', sa.Column('stock_shards', sa.Integer(), server_default='0', nullable=False))
+    op.create_check_constraint('ck_products_stock', 'products', 'stock >= 0')
+    op.create_table(
+        'product_stock_shards',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('shard', sa.Integer(), primary_key=True),
+        sa.Column('stock', sa.Integer(), nullable=False),
+        sa.CheckConstraint('stock >= 0', name='ck_product_stock_shards_stock'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('product_stock_shards')
+    op.drop_constraint('ck_products_stock', 'products', type_='check')
+    op.drop_column('products', 'stock_shards')
+    op.drop_column('products', 'stock')
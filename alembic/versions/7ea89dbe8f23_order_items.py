@@ -0,0 +1,37 @@
+"""Order items
+
+Revision ID: 7ea89dbe8f23
+Revises: a31c38e30b01
+Create Date: 2026-10-18 13:41:56.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7ea89dbe8f23'
+down_revision: Union[str, None] = 'a31c38e30b01'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'order_items',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('total_price', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_order_items_id', 'order_items', ['id'])
+    op.create_index('ix_order_items_order_id_id', 'order_items', ['order_id', 'id'])
+    op.create_index('ix_order_items_product_id', 'order_items', ['product_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('order_items')
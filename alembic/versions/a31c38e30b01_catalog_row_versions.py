@@ -0,0 +1,32 @@
+"""Catalog row versions
+
+Revision ID: a31c38e30b01
+Revises: ef2cfbd17d9c
+Create Date: 2026-10-18 13:05:12.381947
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a31c38e30b01'
+down_revision: Union[str, None] = 'ef2cfbd17d9c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Значения по умолчанию не volatile, поэтому столбцы добавляются без перезаписи таблиц (PostgreSQL 11+)
+def upgrade() -> None:
+    for table in ('categories', 'products'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(),
+                                       nullable=False))
+
+
+def downgrade() -> None:
+    for table in ('products', 'categories'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,33 @@
+"""Idempotency keys
+
+Revision ID: c3d9a4e7b215
+Revises: 5b8e0f6c2d47
+Create Date: 2026-10-18 15:07:33.260418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d9a4e7b215'
+down_revision: Union[str, None] = '5b8e0f6c2d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('fingerprint', sa.String(), nullable=False),
+        sa.Column('response', sa.JSON(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('idempotency_keys')
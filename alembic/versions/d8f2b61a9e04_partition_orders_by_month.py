@@ -0,0 +1,107 @@
+"""Partition orders by month
+
+Revision ID: d8f2b61a9e04
+Revises: c3d9a4e7b215
+Create Date: 2026-10-18 16:40:12.718205
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f2b61a9e04'
+down_revision: Union[str, None] = 'c3d9a4e7b215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_orders_customer_id_id', ['customer_id', 'id']),
+    ('ix_orders_product_id_id', ['product_id', 'id']),
+    ('ix_orders_total_price_id', ['total_price', 'id']),
+]
+# Секции создаются на текущий месяц и столько же месяцев вперёд, сколько по умолчанию создаёт app.partitions
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _orders_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq')"), nullable=False),
+        sa.Column('customer_id', sa.Integer(), sa.ForeignKey('customers.id')),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id')),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('total_price', sa.Float(), nullable=False),
+    ]
+
+
+# Таблица заказов пересоздаётся секционированной по месяцам created_at: строки копируются в новую таблицу
+# (существующим заказам проставляется время миграции), последовательность id сохраняется. Первичный ключ
+# секционированной таблицы включает created_at, поэтому позиции заказов ссылаются на пару (order_id, order_created_at).
+# Таблица блокируется на время копирования
+def upgrade() -> None:
+    op.drop_constraint('order_items_order_id_fkey', 'order_items', type_='foreignkey')
+    op.execute("ALTER TABLE orders RENAME TO orders_unpartitioned")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE orders_unpartitioned DROP CONSTRAINT orders_pkey")
+    op.drop_index('ix_orders_id', table_name='orders_unpartitioned', if_exists=True)
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='orders_unpartitioned', if_exists=True)
+
+    op.create_table(
+        'orders',
+        *_orders_columns(),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at', name='orders_pkey'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    for month in (_add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)):
+        op.execute(f"CREATE TABLE orders_y{month.year:04d}m{month.month:02d} PARTITION OF orders "
+                   f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+                   f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')")
+
+    op.execute("INSERT INTO orders (id, customer_id, product_id, quantity, total_price) "
+               "SELECT id, customer_id, product_id, quantity, total_price FROM orders_unpartitioned")
+    op.drop_table('orders_unpartitioned')
+    for name, columns in INDEXES:
+        op.create_index(name, 'orders', columns)
+
+    op.add_column('order_items', sa.Column('order_created_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE order_items SET order_created_at = orders.created_at FROM orders "
+               "WHERE orders.id = order_items.order_id")
+    op.alter_column('order_items', 'order_created_at', nullable=False)
+    op.create_foreign_key('order_items_order_id_fkey', 'order_items', 'orders', ['order_id', 'order_created_at'],
+                          ['id', 'created_at'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    op.drop_constraint('order_items_order_id_fkey', 'order_items', type_='foreignkey')
+    op.drop_column('order_items', 'order_created_at')
+
+    op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE orders_partitioned DROP CONSTRAINT orders_pkey")
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='orders_partitioned', if_exists=True)
+
+    op.create_table('orders', *_orders_columns(), sa.PrimaryKeyConstraint('id', name='orders_pkey'))
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("INSERT INTO orders (id, customer_id, product_id, quantity, total_price) "
+               "SELECT id, customer_id, product_id, quantity, total_price FROM orders_partitioned")
+    op.drop_table('orders_partitioned')
+    op.create_index('ix_orders_id', 'orders', ['id'])
+    for name, columns in INDEXES:
+        op.create_index(name, 'orders', columns)
+    op.create_foreign_key('order_items_order_id_fkey', 'order_items', 'orders', ['order_id'], ['id'],
+                          ondelete='CASCADE')
@@ -0,0 +1,52 @@
+"""Sales summaries
+
+Revision ID: e9d126ccdaa8
+Revises: a7c52ec02abd
+Create Date: 2026-10-18 10:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9d126ccdaa8'
+down_revision: Union[str, None] = 'a7c52ec02abd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'product_sales',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('orders_count', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+    )
+    op.create_table(
+        'customer_sales',
+        sa.Column('customer_id', sa.Integer(), sa.ForeignKey('customers.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('orders_count', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+    )
+
+    # Начальное заполнение сводок по существующим заказам
+    op.execute("""
+        INSERT INTO product_sales (product_id, orders_count, units, revenue)
+        SELECT product_id, count(*), sum(quantity), sum(total_price)
+        FROM orders WHERE product_id IS NOT NULL GROUP BY product_id
+    """)
+    op.execute("""
+        INSERT INTO customer_sales (customer_id, orders_count, units, revenue)
+        SELECT customer_id, count(*), sum(quantity), sum(total_price)
+        FROM orders WHERE customer_id IS NOT NULL GROUP BY customer_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('customer_sales')
+    op.drop_table('product_sales')
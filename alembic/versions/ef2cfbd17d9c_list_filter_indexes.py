@@ -0,0 +1,39 @@
+"""List filter indexes
+
+Revision ID: ef2cfbd17d9c
+Revises: 0c631c4dcd71
+Create Date: 2026-10-18 12:20:31.604518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ef2cfbd17d9c'
+down_revision: Union[str, None] = '0c631c4dcd71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_products_price_id', 'products', ['price', 'id'], {}),
+    ('ix_products_name_id', 'products', ['name', 'id'], {}),
+    ('ix_products_name_pattern', 'products', ['name'], {'postgresql_ops': {'name': 'text_pattern_ops'}}),
+    ('ix_orders_total_price_id', 'orders', ['total_price', 'id'], {}),
+]
+
+
+# Индексы для фильтров и сортировок списков товаров и заказов, строятся с CONCURRENTLY (вне транзакции)
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **options)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,47 @@
+"""Category sales summary
+
+Revision ID: f41c7a9d2e86
+Revises: d8f2b61a9e04
+Create Date: 2026-10-18 18:05:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f41c7a9d2e86'
+down_revision: Union[str, None] = 'd8f2b61a9e04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'category_sales',
+        sa.Column('category_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('orders_count', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+    )
+
+    # Начальное заполнение по существующим заказам и позициям заказов из корзины: заказ учитывается
+    # в категории один раз, сколько бы товаров этой категории в нём ни было
+    op.execute("""
+        INSERT INTO category_sales (category_id, orders_count, units, revenue)
+        SELECT p.category_id, count(DISTINCT lines.order_id), sum(lines.quantity), sum(lines.total_price)
+        FROM (
+            SELECT id AS order_id, product_id, quantity, total_price FROM orders WHERE product_id IS NOT NULL
+            UNION ALL
+            SELECT order_id, product_id, quantity, total_price FROM order_items
+        ) lines
+        JOIN products p ON p.id = lines.product_id
+        WHERE p.category_id IS NOT NULL
+        GROUP BY p.category_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('category_sales')
@@ -0,0 +1,324 @@
+import asyncio
+import csv
+import json
+import math
+from typing import AsyncIterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud import catalog_cache, passwords
+from app.security import is_password_hash
+
+IMPORT_FORMATS = ("csv", "ndjson")
+# Сколько отклонённых строк перечислять в отчёте (в счётчике учитываются все)
+MAX_REPORTED_ERRORS = 1000
+# Покупатели из staging-таблицы выбираются страницами, пароли страницы проверяются и хешируются параллельно
+# в пуле хеширования
+CUSTOMER_BATCH_SIZE = 1000
+# Ключи кэша каталога удаляются пачками, чтобы не передавать в Redis одну огромную команду
+INVALIDATE_BATCH_SIZE = 1000
+
+# Столбцы staging-таблиц (кроме номера строки входного файла) и их типы в PostgreSQL
+COLUMNS = {
+    "categories": {"name": "text"},
+    "products": {"name": "text", "description": "text", "price": "double precision", "category": "text"},
+    "customers": {"username": "text", "password": "text"},
+}
+# Поле, по которому строка сопоставляется с существующей записью (при повторах в файле используется последняя строка)
+KEYS = {"categories": "name", "products": "name", "customers": "username"}
+
+
+class ImportReport:
+    def __init__(self, entity: str):
+        self.entity = entity
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line: int, detail: str):
+        self.rejected += 1
+        self.errors.append({"line": line, "detail": detail})
+
+    def as_dict(self) -> dict:
+        errors = sorted(self.errors, key=lambda error: error["line"])[:MAX_REPORTED_ERRORS]
+        return {
+            "entity": self.entity,
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.received - self.rejected - self.inserted - self.updated,
+            "rejected": self.rejected,
+            "errors": errors,
+        }
+
+
+# Строки входного потока (байтовые фрагменты произвольной длины) с номерами, начиная с 1
+async def _lines(chunks: AsyncIterable[bytes]):
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            number += 1
+            yield number, line
+    if buffer:
+        yield number + 1, buffer
+
+
+def _decode(number: int, line: bytes) -> str:
+    value = line.decode("utf-8").rstrip("\r")
+    return value.lstrip("﻿") if number == 1 else value
+
+
+# Записи CSV: первая запись - заголовок. Запись заканчивается на строке, после которой число кавычек чётное,
+# поэтому поля в кавычках могут содержать переводы строк. Номер записи - номер её первой строки
+async def _csv_rows(lines):
+    header = None
+    pending = []
+    start = 0
+    async for number, line in lines:
+        if not pending:
+            start = number
+        try:
+            pending.append(_decode(number, line))
+        except UnicodeDecodeError:
+            pending = []
+            yield start, ValueError("Invalid UTF-8")
+            continue
+        record = "\n".join(pending)
+        if record.count('"') % 2:
+            continue
+        pending = []
+        if not record.strip():
+            continue
+        try:
+            values = next(csv.reader([record], strict=True))
+        except csv.Error:
+            yield start, ValueError("Invalid CSV")
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield start, ValueError("Wrong number of fields")
+        else:
+            yield start, dict(zip(header, values))
+    if pending:
+        yield start, ValueError("Unterminated quoted field")
+
+
+async def _ndjson_rows(lines):
+    async for number, line in lines:
+        try:
+            value = _decode(number, line)
+            if not value.strip():
+                continue
+            row = json.loads(value)
+        except ValueError:
+            yield number, ValueError("Invalid JSON")
+            continue
+        yield number, row if isinstance(row, dict) else ValueError("Invalid JSON")
+
+
+def _required(row: dict, field: str) -> str:
+    value = row.get(field)
+    if value is None or not str(value).strip():
+        raise ValueError(f"Missing field '{field}'")
+    return str(value).strip()
+
+
+def _optional(row: dict, field: str) -> Optional[str]:
+    value = row.get(field)
+    return None if value is None or value == "" else str(value)
+
+
+def _price(row: dict) -> float:
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid price")
+    if not math.isfinite(price) or price < 0:
+        raise ValueError("Invalid price")
+    return price
+
+
+def _convert(entity: str, row: dict) -> tuple:
+    if entity == "categories":
+        return (_required(row, "name"),)
+    if entity == "products":
+        return _required(row, "name"), _optional(row, "description"), _price(row), _required(row, "category")
+    return _required(row, "username"), _required(row, "password")
+
+
+# Записи для COPY: (номер строки, значения столбцов). Строки, которые не удалось разобрать, сразу попадают в отчёт
+async def _records(entity: str, rows, report: ImportReport):
+    async for number, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            yield (number, *_convert(entity, row))
+        except ValueError as error:
+            report.reject(number, str(error))
+
+
+# Пароль для записи в customers: None, если пароль существующего покупателя не изменился (проверяется по
+# сохранённому хешу), иначе хеш нового пароля (уже хешированные Argon2 значения сохраняются как есть)
+async def _password(password: str, current: Optional[str]) -> Optional[str]:
+    if is_password_hash(password):
+        return None if password == current else password
+    if current is not None and await passwords.verify(current, password):
+        return None
+    return await passwords.hash(password)
+
+
+# Новые и изменённые покупатели страницы: (username, хеш пароля)
+async def _changed_passwords(rows) -> list:
+    values = await asyncio.gather(*(_password(password, current) for _, password, current in rows))
+    return [(username, value) for (username, _, _), value in zip(rows, values) if value is not None]
+
+
+async def _copy(db: AsyncSession, table: str, records, columns: list) -> str:
+    connection = await (await db.connection()).get_raw_connection()
+    return await connection.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+
+# Отклонённые строки staging-таблицы: повтор ключа (используется последняя строка) и условия сущности
+async def _reject_staged(db: AsyncSession, report: ImportReport, entity: str):
+    key = KEYS[entity]
+    checks = [f"WHEN EXISTS (SELECT 1 FROM import_{entity} later WHERE later.{key} = s.{key} AND later.line > s.line) "
+              f"THEN 'Duplicate {key}, superseded by a later line'"]
+    source = f"import_{entity} s"
+    if entity == "products":
+        source += " LEFT JOIN categories c ON c.name = s.category"
+        checks.insert(0, "WHEN c.id IS NULL THEN 'Category not found'")
+    result = await db.execute(text(f"""
+        SELECT line, detail, count(*) OVER () AS total FROM (
+            SELECT s.line, CASE {' '.join(checks)} END AS detail FROM {source}
+        ) rejected
+        WHERE detail IS NOT NULL
+        ORDER BY line
+        LIMIT :limit
+    """), {"limit": MAX_REPORTED_ERRORS})
+    rows = result.all()
+    for line, detail, _ in rows:
+        report.reject(line, detail)
+    if rows:
+        report.rejected += rows[0].total - len(rows)
+
+
+async def _upsert_categories(db: AsyncSession, report: ImportReport):
+    result = await db.execute(text("""
+        WITH inserted AS (
+            INSERT INTO categories (name) SELECT DISTINCT name FROM import_categories
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id
+        )
+        SELECT count(*) FROM inserted
+    """))
+    report.inserted = result.scalar_one()
+    return ()
+
+
+# Товары сопоставляются по имени, категория - по названию соединением со справочником категорий.
+# Изменённые товары обновляются (с новой версией для ETag), неизменённые не трогаются, новые вставляются.
+# Возвращает id изменённых товаров для сброса кэша
+async def _upsert_products(db: AsyncSession, report: ImportReport):
+    result = await db.execute(text("""
+        WITH source AS (
+            SELECT DISTINCT ON (s.name) s.name, s.description, s.price, c.id AS category_id
+            FROM import_products s JOIN categories c ON c.name = s.category
+            ORDER BY s.name, s.line DESC
+        ), updated AS (
+            UPDATE products p
+            SET description = source.description, price = source.price, category_id = source.category_id,
+                version = p.version + 1, updated_at = now()
+            FROM source
+            WHERE p.name = source.name AND (p.description, p.price, p.category_id)
+                IS DISTINCT FROM (source.description, source.price, source.category_id)
+            RETURNING p.id
+        ), inserted AS (
+            INSERT INTO products (name, description, price, category_id)
+            SELECT name, description, price, category_id FROM source
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.name = source.name)
+            RETURNING id
+        )
+        SELECT (SELECT count(*) FROM inserted) AS inserted, (SELECT array_agg(id) FROM updated) AS updated
+    """))
+    row = result.one()
+    report.inserted = row.inserted
+    report.updated = len(row.updated or ())
+    return row.updated or ()
+
+
+# В staging-таблице пароли покупателей не хешированы: хешировать с новой солью каждую строку значило бы
+# обновлять всех покупателей при каждой загрузке. Пароли существующих покупателей проверяются по сохранённым хешам,
+# хешируются и записываются только новые и изменённые
+async def _upsert_customers(db: AsyncSession, report: ImportReport):
+    await db.execute(text("CREATE TEMP TABLE import_customer_passwords (username text, password text) "
+                          "ON COMMIT DROP"))
+    after = ""
+    while True:
+        result = await db.execute(text("""
+            SELECT DISTINCT ON (s.username) s.username, s.password, c.password AS current
+            FROM import_customers s LEFT JOIN customers c ON c.username = s.username
+            WHERE s.username > :after
+            ORDER BY s.username, s.line DESC
+            LIMIT :limit
+        """), {"after": after, "limit": CUSTOMER_BATCH_SIZE})
+        rows = result.all()
+        if not rows:
+            break
+        changed = await _changed_passwords(rows)
+        if changed:
+            await _copy(db, "import_customer_passwords", changed, ["username", "password"])
+        after = rows[-1].username
+
+    result = await db.execute(text("""
+        WITH upserted AS (
+            INSERT INTO customers (username, password)
+            SELECT username, password FROM import_customer_passwords
+            ON CONFLICT (username) DO UPDATE SET password = excluded.password
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted) AS inserted, count(*) FILTER (WHERE NOT inserted) AS updated
+        FROM upserted
+    """))
+    row = result.one()
+    report.inserted, report.updated = row.inserted, row.updated
+    return ()
+
+
+UPSERTS = {"categories": _upsert_categories, "products": _upsert_products, "customers": _upsert_customers}
+
+
+# Массовая загрузка: входной поток разбирается по мере чтения и передаётся через COPY (asyncpg) во временную
+# staging-таблицу, затем записи вставляются и обновляются одним запросом на сущность, всё в одной транзакции.
+# Возвращает отчёт: сколько строк получено, вставлено, обновлено, не изменилось и отклонено (с причинами)
+async def import_rows(db: AsyncSession, entity: str, chunks: AsyncIterable[bytes], import_format: str) -> dict:
+    report = ImportReport(entity)
+    lines = _lines(chunks)
+    records = _records(entity, _csv_rows(lines) if import_format == "csv" else _ndjson_rows(lines), report)
+
+    columns = COLUMNS[entity]
+    staging = f"import_{entity}"
+    definition = ", ".join(f"{name} {column_type}" for name, column_type in columns.items())
+    await db.execute(text(f"CREATE TEMP TABLE {staging} (line integer NOT NULL, {definition}) ON COMMIT DROP"))
+    status = await _copy(db, staging, records, ["line", *columns])
+    report.received = int(status.split()[-1]) + report.rejected
+
+    # Статистика и индекс по ключу для проверки повторов и сопоставления (временные таблицы не анализируются
+    # автоматически)
+    await db.execute(text(f"CREATE INDEX ON {staging} ({KEYS[entity]}, line)"))
+    await db.execute(text(f"ANALYZE {staging}"))
+    await _reject_staged(db, report, entity)
+    updated_ids = await UPSERTS[entity](db, report)
+    await db.commit()
+
+    if entity in ("categories", "products"):
+        keys = [f"product:{product_id}" for product_id in updated_ids]
+        for start in range(0, max(len(keys), 1), INVALIDATE_BATCH_SIZE):
+            await catalog_cache.invalidate(entity, *keys[start:start + INVALIDATE_BATCH_SIZE])
+    return report.as_dict()
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+# Кэш в памяти процесса: LRU с ограничением размера и временем жизни записей
+class MemoryBackend:
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._versions = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any):
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    # Версии пространств имён и ключей записей хранятся отдельно и не вытесняются, иначе после вытеснения вернулись
+    # бы старые списки и записи
+    async def get_version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    async def incr_version(self, *keys: str):
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    async def set_if_version(self, key: str, value: Any, version: int):
+        if self._versions.get(key, 0) == version:
+            await self.set(key, value)
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+# Общий кэш для нескольких процессов поверх клиента redis.asyncio (или совместимой замены в тестах).
+# Значения хранятся в JSON, вытеснение по размеру выполняет сам Redis (maxmemory-policy).
+# Увеличение версий и запись с проверкой версии выполняются скриптами Lua: одной командой и атомарно
+class RedisBackend:
+    INCR_VERSIONS_SCRIPT = "for _, key in ipairs(KEYS) do redis.call('INCR', key) end"
+    SET_IF_VERSION_SCRIPT = (
+        "if tonumber(redis.call('GET', KEYS[2]) or '0') == tonumber(ARGV[2]) then "
+        "redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3]) end"
+    )
+
+    def __init__(self, client, ttl: float = 60.0, prefix: str = "catalog:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=max(int(self.ttl), 1))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def get_version(self, key: str) -> int:
+        return int(await self.client.get(self.prefix + "version:" + key) or 0)
+
+    async def incr_version(self, *keys: str):
+        await self.client.eval(self.INCR_VERSIONS_SCRIPT, len(keys), *(self.prefix + "version:" + key for key in keys))
+
+    async def set_if_version(self, key: str, value: Any, version: int):
+        await self.client.eval(self.SET_IF_VERSION_SCRIPT, 2, self.prefix + key, self.prefix + "version:" + key,
+                               json.dumps(value), version, max(int(self.ttl), 1))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class Cache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    # Поколение ключа: читается до запроса к БД при промахе и передаётся в set. invalidate увеличивает поколения
+    # сброшенных ключей, поэтому значение, прочитанное до изменения и записанное после сброса, не сохраняется
+    async def generation(self, key: str) -> int:
+        return await self.backend.get_version(key)
+
+    async def set(self, key: str, value: Any, generation: Optional[int] = None):
+        if generation is None:
+            await self.backend.set(key, value)
+        else:
+            await self.backend.set_if_version(key, value, generation)
+
+    # Ключ списка включает версию пространства имён: любая запись в нём делает все закэшированные списки неактуальными
+    async def list_key(self, namespace: str, *parts) -> str:
+        version = await self.backend.get_version(namespace)
+        return f"{namespace}:v{version}:" + ":".join(str(part) for part in parts)
+
+    async def invalidate(self, namespace: str, *keys: str):
+        await self.backend.delete(*keys)
+        await self.backend.incr_version(namespace, *keys)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self.backend.size(),
+        }
+
+
+# Бэкенд выбирается переменными окружения: CATALOG_CACHE_URL=redis://... включает общий кэш
+def create_backend():
+    ttl = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+    url = os.getenv("CATALOG_CACHE_URL")
+    if url:
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("CATALOG_CACHE_URL requires the 'redis' package")
+        return RedisBackend(redis.from_url(url), ttl=ttl)
+    return MemoryBackend(max_size=int(os.getenv("CATALOG_CACHE_SIZE", "1024")), ttl=ttl)
@@ -0,0 +1,86 @@
+# Служебные команды: python -m app.commands <команда>
+
+import argparse
+import asyncio
+import json
+from datetime import date, datetime, timezone
+
+from app import crud
+from app.bulk_import import IMPORT_FORMATS, import_rows
+from app.partitions import ORDER_PARTITION_MONTHS_AHEAD, add_months, archive_order_partitions, create_order_partitions
+from app.database import SessionLocal
+
+
+async def rebuild_sales(args):
+    async with SessionLocal() as db:
+        await crud.rebuild_sales_summaries(db)
+    print("Sales summaries rebuilt.")
+
+
+async def purge_idempotency_keys(args):
+    async with SessionLocal() as db:
+        deleted = await crud.delete_expired_idempotency_keys(db)
+    print(f"Expired idempotency keys deleted: {deleted}.")
+
+
+async def create_partitions(args):
+    async with SessionLocal() as db:
+        created = await create_order_partitions(db, months_ahead=args.months_ahead)
+    print(f"Order partitions created: {', '.join(created) or 'none'}.")
+
+
+async def archive_orders(args):
+    before = date.fromisoformat(args.before) if args.before else add_months(
+        datetime.now(timezone.utc).date().replace(day=1), 1 - args.keep_months)
+    async with SessionLocal() as db:
+        archived = await archive_order_partitions(db, before, args.directory, keep=args.keep_tables)
+    for partition in archived:
+        print(f"{partition['partition']}: {partition['orders']} orders -> {partition['path']}")
+    print(f"Order partitions archived: {len(archived)}.")
+
+
+# Файл читается фрагментами, поэтому размер загрузки не ограничен памятью процесса
+async def _file_chunks(path: str, size: int = 1 << 20):
+    with open(path, "rb") as f:
+        while chunk := f.read(size):
+            yield chunk
+
+
+async def import_file(args):
+    import_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    async with SessionLocal() as db:
+        report = await import_rows(db, args.entity, _file_chunks(args.path), import_format)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.commands", description="Maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-sales", help="recompute sales summaries from the orders table").set_defaults(
+        handler=rebuild_sales)
+    subparsers.add_parser("purge-idempotency-keys", help="delete expired order idempotency keys").set_defaults(
+        handler=purge_idempotency_keys)
+    partitions_parser = subparsers.add_parser("create-order-partitions",
+                                              help="create monthly order partitions for the coming months")
+    partitions_parser.add_argument("--months-ahead", type=int, default=ORDER_PARTITION_MONTHS_AHEAD)
+    partitions_parser.set_defaults(handler=create_partitions)
+    archive_parser = subparsers.add_parser("archive-orders", help="export and detach old monthly order partitions")
+    archive_parser.add_argument("directory", help="directory for the exported NDJSON files")
+    archive_parser.add_argument("--keep-months", type=int, default=12,
+                                help="months to keep, including the current one (default: 12)")
+    archive_parser.add_argument("--before", help="archive partitions of months before this date (YYYY-MM-DD)")
+    archive_parser.add_argument("--keep-tables", action="store_true", help="keep detached partitions as tables")
+    archive_parser.set_defaults(handler=archive_orders)
+    import_parser = subparsers.add_parser("import", help="bulk load categories, products or customers from a file")
+    import_parser.add_argument("entity", choices=["categories", "products", "customers"])
+    import_parser.add_argument("path", help="CSV or NDJSON file")
+    import_parser.add_argument("--format", choices=IMPORT_FORMATS, help="file format (default: by extension)")
+    import_parser.set_defaults(handler=import_file)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
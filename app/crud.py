@@ -1,14 +1,161 @@
+import json
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete
+from sqlalchemy.orm import noload, selectinload
+from sqlalchemy import (Integer, update, delete, insert, any_, bindparam, lambda_stmt, literal, literal_column, func,
+                        and_, or_, text, tuple_)
 from app import models, schemas
+from app.cache import Cache, create_backend
+from app.security import create_password_hasher
+
+# Кэш каталога (категории и товары), сбрасывается при записи через функции этого модуля
+catalog_cache = Cache(create_backend())
+
+# Пул хеширования паролей покупателей
+passwords = create_password_hasher()
+
+
+# Остатка товара не хватает для заказа; транзакция заказа к этому моменту уже отменена
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+
+
+# Запись выполняется одним запросом с RETURNING и сразу фиксируется (on_row выполняется в той же транзакции).
+# Возвращает строку или None, если запрос ничего не изменил (тогда транзакция, включая предшествующие запросы,
+# отменяется); нарушение ограничений пробрасывается как IntegrityError, нехватка остатка - как InsufficientStock
+async def _execute_returning(db: AsyncSession, statement, on_row=None):
+    try:
+        result = await db.execute(statement)
+        row = result.mappings().first()
+        if row is not None and on_row is not None:
+            await on_row(row)
+        if row is None:
+            await db.rollback()
+        else:
+            await db.commit()
+    except (IntegrityError, InsufficientStock):
+        await db.rollback()
+        raise
+    return row
+
+
+# Сессия, из которой заполняется кэш каталога. Реплика может отставать: строка, прочитанная с неё после изменения,
+# осталась бы в общем кэше на весь TTL, и даже закреплённый за основной БД клиент не увидел бы своё изменение.
+# Поэтому в сессии реплики (в info - sessionmaker основной БД) промах кэша читается с основной БД
+@asynccontextmanager
+async def _cache_source(db: AsyncSession):
+    primary = db.info.get("primary")
+    if primary is None:
+        yield db
+    else:
+        async with primary() as session:
+            yield session
+
+
+# Чтение через кэш каталога: при промахе выполняем запрос и сохраняем результат в виде словаря (JSON-совместимого).
+# Поколение ключа читается до запроса: если запись изменили и сбросили из кэша, пока выполнялся запрос,
+# прочитанная старая строка в кэш не попадает
+async def _cached_first(db: AsyncSession, key: str, schema, query):
+    cached = await catalog_cache.get(key)
+    if cached is None:
+        generation = await catalog_cache.generation(key)
+        async with _cache_source(db) as source:
+            result = await source.execute(query)
+            row = result.scalars().first()
+            if row is None:
+                return None
+            cached = schema.model_validate(row, from_attributes=True).model_dump(mode="json")
+        await catalog_cache.set(key, cached, generation)
+    return schema.model_validate(cached)
+
+
+# Частые запросы чтения записываются как lambda_stmt: SQLAlchemy кэширует такой запрос по месту объявления lambda
+# и при повторных вызовах не строит конструкцию select и её ключ кэша заново, а подставляет только значения
+# параметров (переменные из замыкания). Условия, зависящие от аргументов, добавляются через +=.
+# Запросы записи каталога по id вынесены в функции, чтобы прогрев выполнял те же lambda без кэша каталога
+def _catalog_query(model, object_id: int):
+    return lambda_stmt(lambda: select(model).filter(model.id == object_id))
+
+
+# Версия записи каталога: выборка двух столбцов по первичному ключу, без загрузки всей строки
+def _version_query(model, object_id: int):
+    return lambda_stmt(lambda: select(model.version, model.updated_at).filter(model.id == object_id))
+
+
+# Версия записи каталога для условного запроса: из кэша, а при промахе - запросом _version_query
+async def _cached_version(db: AsyncSession, key: str, model, object_id: int):
+    cached = await catalog_cache.get(key)
+    if cached is not None:
+        return schemas.CatalogVersion.model_validate(cached)
+    result = await db.execute(_version_query(model, object_id))
+    row = result.first()
+    return None if row is None else schemas.CatalogVersion.model_validate(row, from_attributes=True)
+
+
+# Списки выбираются строками таблицы (select(table)), а не ORM-объектами: без identity map и отслеживания изменений
+async def _cached_all(db: AsyncSession, key: str, schema, query):
+    cached = await catalog_cache.get(key)
+    if cached is None:
+        async with _cache_source(db) as source:
+            result = await source.execute(query)
+            cached = [schema.model_validate(row, from_attributes=True).model_dump(mode="json") for row in result.all()]
+        await catalog_cache.set(key, cached)
+    return [schema.model_validate(item) for item in cached]
+
+
+# Сортировка списка: sort - имя поля, '-' в начале - по убыванию; при равных значениях порядок задаёт id.
+# Следующая страница курсора (after - пара значение поля и id) выбирается сравнением пар (поле, id),
+# что обслуживается составным индексом (поле, id) без OFFSET
+def _sort_page(query, model, sort: str, skip: int = 0, after: Optional[tuple] = None):
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    keys = (model.id,) if field == "id" else (getattr(model, field), model.id)
+    if after is not None:
+        current, last = tuple_(*keys), tuple_(*after[-len(keys):])
+        query = query.filter(current < last if descending else current > last)
+    else:
+        query = query.offset(skip)
+    return query.order_by(*(key.desc() if descending else key for key in keys))
+
+
+# Выборка по списку id одним запросом: в PostgreSQL id = ANY(:ids) с одним параметром-массивом, поэтому выражение
+# одно для любого числа id; в остальных БД (без массивов) - id IN (...). Возвращает записи в порядке ids
+# (повторы - один раз) и id, для которых записей нет
+async def _get_by_ids(db: AsyncSession, query, id_column, ids: List[int], scalars: bool = False):
+    ids = list(dict.fromkeys(ids))
+    if db.bind.dialect.name == "postgresql":
+        query = query.where(id_column == any_(literal(ids, ARRAY(Integer))))
+    else:
+        query = query.where(id_column.in_(ids))
+    result = await db.execute(query)
+    found = {row.id: row for row in (result.scalars().all() if scalars else result.all())}
+    return [found[object_id] for object_id in ids if object_id in found], [
+        object_id for object_id in ids if object_id not in found]
+
+
+# Шаблон LIKE для поиска по префиксу: спецсимволы префикса экранируются
+def _like_prefix(prefix: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", prefix) + "%"
 
 
 # === Functions for Categories ===
 
 async def get_category(db: AsyncSession, category_id: int):
-    result = await db.execute(select(models.Category).filter(models.Category.id == category_id))
-    return result.scalars().first()
+    return await _cached_first(db, f"category:{category_id}", schemas.Category,
+                               _catalog_query(models.Category, category_id))
+
+
+async def get_category_version(db: AsyncSession, category_id: int):
+    return await _cached_version(db, f"category:{category_id}", models.Category, category_id)
 
 
 async def get_category_by_name(db: AsyncSession, name: str):
@@ -17,33 +164,54 @@ async def get_category_by_name(db: AsyncSession, name: str):
 
 
 async def create_category(db: AsyncSession, category: schemas.CategoryCreate):
-    db_category = models.Category(name=category.name)
-    db.add(db_category)
-    await db.commit()
-    await db.refresh(db_category)
+    table = models.Category.__table__
+    db_category = await _execute_returning(db, pg_insert(table).values(name=category.name).on_conflict_do_nothing(
+        index_elements=[table.c.name]).returning(*table.c))
+    if db_category is not None:
+        await catalog_cache.invalidate("categories")
     return db_category
 
 
 async def update_category(db: AsyncSession, category_id: int, category: schemas.CategoryUpdate):
-    await db.execute(update(models.Category).where(models.Category.id == category_id).values(name=category.name))
-    await db.commit()
+    table = models.Category.__table__
+    db_category = await _execute_returning(db, update(table).where(table.c.id == category_id).values(
+        name=category.name, version=table.c.version + 1, updated_at=func.now()).returning(*table.c))
+    await catalog_cache.invalidate("categories", f"category:{category_id}")
+    return db_category
 
 
+# Удаление одним запросом с RETURNING: возвращает удалённую строку или None, если записи не было
 async def delete_category(db: AsyncSession, category_id: int):
-    await db.execute(delete(models.Category).where(models.Category.id == category_id))
-    await db.commit()
+    table = models.Category.__table__
+    db_category = await _execute_returning(db, delete(table).where(table.c.id == category_id).returning(*table.c))
+    if db_category is not None:
+        await catalog_cache.invalidate("categories", f"category:{category_id}")
+    return db_category
+
 
+async def get_categories(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    query = select(models.Category.__table__).order_by(models.Category.id)
+    if after_id is not None:
+        query = query.filter(models.Category.id > after_id)
+    else:
+        query = query.offset(skip)
+    key = await catalog_cache.list_key("categories", skip, limit, after_id)
+    return await _cached_all(db, key, schemas.Category, query.limit(limit))
 
-async def get_categories(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(models.Category).offset(skip).limit(limit))
-    return result.scalars().all()
+
+async def get_categories_by_ids(db: AsyncSession, ids: List[int]):
+    return await _get_by_ids(db, select(models.Category.__table__), models.Category.id, ids)
 
 
 # === Functions for Products ===
 
 async def get_product(db: AsyncSession, product_id: int):
-    result = await db.execute(select(models.Product).filter(models.Product.id == product_id))
-    return result.scalars().first()
+    return await _cached_first(db, f"product:{product_id}", schemas.Product,
+                               _catalog_query(models.Product, product_id))
+
+
+async def get_product_version(db: AsyncSession, product_id: int):
+    return await _cached_version(db, f"product:{product_id}", models.Product, product_id)
 
 
 async def get_product_by_name(db: AsyncSession, product_name: str):
@@ -51,81 +219,601 @@ async def get_product_by_name(db: AsyncSession, product_name: str):
     return result.scalars().first()
 
 
+# INSERT ... SELECT ... WHERE NOT EXISTS: товар вставляется, только если товара с таким именем ещё нет
 async def create_product(db: AsyncSession, product: schemas.ProductCreate):
-    db_product = models.Product(name=product.name, category_id=product.category_id, description=product.description,
-                                price=product.price)
-    db.add(db_product)
-    await db.commit()
-    await db.refresh(db_product)
+    table = models.Product.__table__
+    other = table.alias("other")
+    values = dict(name=product.name, description=product.description, price=product.price,
+                  category_id=product.category_id)
+    source = select(*(literal(value, table.c[key].type) for key, value in values.items())).where(
+        ~select(other.c.id).where(other.c.name == product.name).exists())
+    db_product = await _execute_returning(db, insert(table).from_select(list(values), source).returning(*table.c))
+    if db_product is not None:
+        await catalog_cache.invalidate("products")
     return db_product
 
 
 async def update_product(db: AsyncSession, product_id: int, product: schemas.ProductUpdate):
-    await db.execute(update(models.Product).where(models.Product.id == product_id).values(
+    table = models.Product.__table__
+    other = table.alias("other")
+    db_product = await _execute_returning(db, update(table).where(
+        table.c.id == product_id,
+        ~select(other.c.id).where(other.c.name == product.name, other.c.id != product_id).exists()
+    ).values(
         name=product.name,
+        description=product.description,
         category_id=product.category_id,
-        price=product.price
-    ))
-    await db.commit()
+        price=product.price,
+        version=table.c.version + 1,
+        updated_at=func.now()
+    ).returning(*table.c))
+    await catalog_cache.invalidate("products", f"product:{product_id}")
+    return db_product
 
 
 async def delete_product(db: AsyncSession, product_id: int):
-    await db.execute(delete(models.Product).where(models.Product.id == product_id))
-    await db.commit()
+    table = models.Product.__table__
+    db_product = await _execute_returning(db, delete(table).where(table.c.id == product_id).returning(*table.c))
+    if db_product is not None:
+        await catalog_cache.invalidate("products", f"product:{product_id}")
+    return db_product
+
+
+async def get_products_by_ids(db: AsyncSession, ids: List[int]):
+    return await _get_by_ids(db, select(models.Product.__table__), models.Product.id, ids)
+
+
+# Фильтры списка товаров обслуживаются индексами: (category_id, id), (price, id) и name text_pattern_ops для префикса
+async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[tuple] = None,
+                       sort: str = "id", category_id: Optional[int] = None, price_min: Optional[float] = None,
+                       price_max: Optional[float] = None, name_prefix: Optional[str] = None):
+    query = select(models.Product.__table__)
+    if category_id is not None:
+        query = query.filter(models.Product.category_id == category_id)
+    if price_min is not None:
+        query = query.filter(models.Product.price >= price_min)
+    if price_max is not None:
+        query = query.filter(models.Product.price <= price_max)
+    if name_prefix:
+        query = query.filter(models.Product.name.like(_like_prefix(name_prefix), escape="\\"))
+    query = _sort_page(query, models.Product, sort, skip, after)
+    # Параметры ключа сериализуются в JSON, так как префикс имени - произвольная строка
+    key = await catalog_cache.list_key("products", json.dumps(
+        [skip, limit, after, sort, category_id, price_min, price_max, name_prefix]))
+    return await _cached_all(db, key, schemas.Product, query.limit(limit))
+
+
+# Поиск товаров: полнотекстовый по имени и описанию (каждое слово как префикс) и нечёткий по имени через
+# триграммы (устойчив к опечаткам). Оба условия обслуживаются GIN-индексами, результат ранжируется по сумме оценок
+async def search_products(db: AsyncSession, q: str, category_id: Optional[int] = None, limit: int = 20):
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return []
+
+    document = models.product_search_document(models.Product.name, models.Product.description)
+    ts_query = func.to_tsquery(literal_column("'simple'"), " & ".join(word + ":*" for word in words))
+    fuzzy_text = " ".join(words)
+    rank = func.ts_rank(document, ts_query) + func.word_similarity(fuzzy_text, models.Product.name)
+
+    query = select(models.Product.__table__).filter(or_(
+        document.bool_op("@@")(ts_query),
+        literal(fuzzy_text).bool_op("<%")(models.Product.name)
+    ))
+    if category_id is not None:
+        query = query.filter(models.Product.category_id == category_id)
+    result = await db.execute(query.order_by(rank.desc(), models.Product.id).limit(limit))
+    return result.all()
+
+
+# Товары категории по индексу (category_id, id); категория подгружается отдельным запросом только по запросу,
+# без неё выбираются строки таблицы
+async def get_category_products(db: AsyncSession, category_id: int, limit: int = 100, after_id: Optional[int] = None,
+                                include_category: bool = False):
+    if include_category:
+        query = lambda_stmt(lambda: select(models.Product).options(selectinload(models.Product.category)))
+    else:
+        query = lambda_stmt(lambda: select(models.Product.__table__))
+    query += lambda s: s.filter(models.Product.category_id == category_id)
+    if after_id is not None:
+        query += lambda s: s.filter(models.Product.id > after_id)
+    query += lambda s: s.order_by(models.Product.id).limit(limit)
+    result = await db.execute(query)
+    return result.scalars().all() if include_category else result.all()
+
+
+async def stream_products(db: AsyncSession, batch_size: int = 1000):
+    result = await db.stream(select(models.Product.__table__).order_by(models.Product.id).execution_options(
+        yield_per=batch_size))
+    async for rows in result.mappings().partitions():
+        yield rows
+
+
+# Остаток товара: в строке товара или сумма частей остатка (пустой, если остаток не учитывается)
+async def get_product_stock(db: AsyncSession, product_id: int):
+    products = models.Product.__table__
+    shards = models.ProductStockShard.__table__
+    shards_stock = select(func.sum(shards.c.stock)).where(shards.c.product_id == products.c.id).scalar_subquery()
+    result = await db.execute(select(
+        products.c.id.label("product_id"),
+        func.coalesce(products.c.stock, shards_stock).label("stock"),
+        products.c.stock_shards.label("shards")
+    ).where(products.c.id == product_id))
+    return result.mappings().first()
+
+
+# Установка остатка (абсолютного значения) и режима учёта в одной транзакции. В режиме частей остаток делится
+# поровну между частями, строка товара при покупке не блокируется. Кэш и версия товара не меняются
+async def set_product_stock(db: AsyncSession, product_id: int, stock: schemas.ProductStockUpdate):
+    products = models.Product.__table__
+    shards = models.ProductStockShard.__table__
+
+    async def on_row(row):
+        await db.execute(delete(shards).where(shards.c.product_id == product_id))
+        if stock.shards:
+            await db.execute(insert(shards), [
+                {"product_id": product_id, "shard": shard,
+                 "stock": stock.stock // stock.shards + (shard < stock.stock % stock.shards)}
+                for shard in range(stock.shards)
+            ])
+
+    db_product = await _execute_returning(db, update(products).where(products.c.id == product_id).values(
+        stock=None if stock.shards else stock.stock,
+        stock_shards=stock.shards
+    ).returning(products.c.id), on_row=on_row)
+    return None if db_product is None else dict(stock.model_dump(), product_id=product_id)
+
+
+# Списание остатка без предварительного чтения и блокировки: условный UPDATE ... WHERE stock >= :quantity
+# RETURNING price по строке товара и такой же UPDATE случайной части остатка, выбранной с SKIP LOCKED
+# (части, заблокированные параллельными покупками, пропускаются). Оба UPDATE - CTE одного запроса, итоговый SELECT
+# возвращает цену и признак списания (для товара без учёта остатка - всегда списано) или ничего, если товара нет
+def _reservation(product_id: int, quantity: int, skip_locked: bool):
+    products = models.Product.__table__
+    shards = models.ProductStockShard.__table__
+    reserved = update(products).where(
+        products.c.id == product_id,
+        products.c.stock >= quantity
+    ).values(stock=products.c.stock - quantity).returning(products.c.id, products.c.price).cte("reserved")
+    shard = select(shards.c.shard).where(
+        shards.c.product_id == product_id,
+        shards.c.stock >= quantity
+    ).order_by(func.random()).limit(1).with_for_update(skip_locked=skip_locked).scalar_subquery()
+    taken = update(shards).where(
+        shards.c.product_id == product_id,
+        shards.c.shard == shard,
+        shards.c.stock >= quantity
+    ).values(stock=shards.c.stock - quantity).returning(shards.c.product_id).cte("taken")
+    return select(
+        func.coalesce(reserved.c.price, products.c.price).label("price"),
+        or_(reserved.c.id.isnot(None), taken.c.product_id.isnot(None),
+            and_(products.c.stock.is_(None), products.c.stock_shards == 0)).label("reserved"),
+        products.c.stock_shards
+    ).select_from(products.outerjoin(reserved, reserved.c.id == products.c.id).outerjoin(
+        taken, taken.c.product_id == products.c.id)
+    ).where(products.c.id == product_id)
+
+
+async def _reserve(db: AsyncSession, product_id: int, quantity: int):
+    if db.bind.dialect.name != "postgresql":
+        return await _reserve_without_cte(db, product_id, quantity)
+    result = await db.execute(_reservation(product_id, quantity, skip_locked=True))
+    row = result.mappings().first()
+    if row is not None and not row["reserved"] and row["stock_shards"]:
+        # Все части с достаточным остатком заблокированы параллельными покупками или остатка не хватает
+        # ни в одной части - списываем с нескольких частей
+        row = dict(row, reserved=await _reserve_from_shards(db, product_id, quantity))
+    return row
+
+
+# Списание без CTE для СУБД, где UPDATE не может быть частью WITH (SQLite): условный UPDATE ... RETURNING price
+# по строке товара, а если он ничего не изменил - чтение товара и списание с частей остатка
+async def _reserve_without_cte(db: AsyncSession, product_id: int, quantity: int):
+    products = models.Product.__table__
+    result = await db.execute(update(products).where(
+        products.c.id == product_id,
+        products.c.stock >= quantity
+    ).values(stock=products.c.stock - quantity).returning(products.c.price))
+    price = result.scalar()
+    if price is not None:
+        return {"price": price, "reserved": True, "stock_shards": 0}
+    result = await db.execute(select(products.c.price, products.c.stock, products.c.stock_shards).where(
+        products.c.id == product_id))
+    row = result.mappings().first()
+    if row is None:
+        return None
+    if row["stock_shards"]:
+        reserved = await _reserve_from_shards(db, product_id, quantity)
+    else:
+        reserved = row["stock"] is None
+    return {"price": row["price"], "reserved": reserved, "stock_shards": row["stock_shards"]}
+
+
+# Списание с нескольких частей остатка (редкий случай): все части товара блокируются в порядке номеров,
+# количество списывается по порядку, пока не наберётся нужное
+async def _reserve_from_shards(db: AsyncSession, product_id: int, quantity: int) -> bool:
+    shards = models.ProductStockShard.__table__
+    result = await db.execute(select(shards.c.shard, shards.c.stock).where(
+        shards.c.product_id == product_id).order_by(shards.c.shard).with_for_update())
+    taken = []
+    for shard, stock in result.tuples().all():
+        if quantity <= 0:
+            break
+        if stock > 0:
+            taken.append({"taken_shard": shard, "taken": min(stock, quantity)})
+            quantity -= stock
+    if quantity > 0:
+        return False
+    await db.execute(update(shards).where(
+        shards.c.product_id == product_id,
+        shards.c.shard == bindparam("taken_shard")
+    ).values(stock=shards.c.stock - bindparam("taken")), taken)
+    return True
+
+
+# Списание остатков (lines - количество по товарам) в порядке id товаров, чтобы параллельные транзакции
+# блокировали строки в одном порядке. Возвращает цены найденных товаров; при нехватке остатка транзакция
+# отменяется и выбрасывается InsufficientStock
+async def _reserve_stock(db: AsyncSession, lines: dict) -> dict:
+    prices = {}
+    for product_id, quantity in sorted(lines.items()):
+        row = await _reserve(db, product_id, quantity)
+        if row is None:
+            continue
+        if not row["reserved"]:
+            await db.rollback()
+            raise InsufficientStock(product_id)
+        prices[product_id] = row["price"]
+    return prices
+
+
+# Возврат остатка при удалении или изменении заказа: в строку товара или в случайную часть остатка.
+# В PostgreSQL оба UPDATE выполняются одним запросом (первый - CTE), в других СУБД - двумя
+async def _release_stock(db: AsyncSession, lines: dict):
+    products = models.Product.__table__
+    shards = models.ProductStockShard.__table__
+    for product_id, quantity in sorted(lines.items()):
+        restored = update(products).where(
+            products.c.id == product_id,
+            products.c.stock.isnot(None)
+        ).values(stock=products.c.stock + quantity)
+        shard = select(shards.c.shard).where(shards.c.product_id == product_id).order_by(func.random()).limit(1)
+        taken_back = update(shards).where(
+            shards.c.product_id == product_id,
+            shards.c.shard == shard.scalar_subquery()
+        ).values(stock=shards.c.stock + quantity)
+        if db.bind.dialect.name == "postgresql":
+            await db.execute(taken_back.add_cte(restored.cte("restored")))
+        else:
+            await db.execute(restored)
+            await db.execute(taken_back)
 
 
-async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(models.Product).offset(skip).limit(limit))
-    return result.scalars().all()
+# Учитывается ли остаток товара (в строке товара или частями)
+def _stock_tracked():
+    return or_(models.Product.stock.isnot(None), models.Product.stock_shards > 0).label("tracked")
+
+
+# Количество по товарам в заказе и его позициях (для списания и возврата остатков)
+def _stock_lines(*orders) -> dict:
+    lines = {}
+    for order in orders:
+        if order["product_id"] is not None:
+            lines[order["product_id"]] = lines.get(order["product_id"], 0) + order["quantity"]
+    return lines
 
 
 # === Functions for Orders ===
 
+# Позиции заказа загружаются вторым запросом (selectinload) по индексу (order_id, id)
 async def get_order(db: AsyncSession, order_id: int):
-    result = await db.execute(select(models.Order).filter(models.Order.id == order_id))
+    result = await db.execute(lambda_stmt(lambda: select(models.Order).filter(models.Order.id == order_id).options(
+        selectinload(models.Order.items))))
     return result.scalars().first()
 
 
-async def create_order(db: AsyncSession, order: schemas.OrderCreate):
-    product = await db.execute(select(models.Product).filter(models.Product.id == order.product_id))
-    product_price = product.scalars().first().price
-    total_price = product_price * order.quantity
+# Остаток списывается условным UPDATE, который возвращает и цену товара; затем INSERT ... SELECT с проверкой
+# покупателя. Заказ не создаётся без товара или покупателя (списание отменяется вместе с транзакцией).
+# Если передан захваченный ключ идемпотентности, ответ сохраняется в нём в той же транзакции
+async def create_order(db: AsyncSession, order: schemas.OrderCreate, idempotency_key: Optional[str] = None):
+    table = models.Order.__table__
+    customers = models.Customer.__table__
+    prices = await _reserve_stock(db, {order.product_id: order.quantity})
+    if order.product_id not in prices:
+        await db.rollback()
+        return None
 
-    db_order = models.Order(customer_id=order.customer_id, product_id=order.product_id, quantity=order.quantity, total_price=total_price)
-    db.add(db_order)
-    await db.commit()
-    await db.refresh(db_order)
-    return db_order
+    source = select(
+        literal(order.customer_id, table.c.customer_id.type),
+        literal(order.product_id, table.c.product_id.type),
+        literal(order.quantity, table.c.quantity.type),
+        literal(prices[order.product_id] * order.quantity, table.c.total_price.type)
+    ).where(select(customers.c.id).where(customers.c.id == order.customer_id).exists())
+
+    async def on_row(row):
+        await _apply_sales(db, [(row, 1)])
+        if idempotency_key is not None:
+            await _store_idempotent_response(db, idempotency_key, schemas.Order.model_validate(dict(row)))
+
+    return await _execute_returning(db, insert(table).from_select(
+        ["customer_id", "product_id", "quantity", "total_price"], source).returning(*table.c), on_row=on_row)
+
+
+# Заказ из корзины: цены всех товаров загружаются одним запросом, остатки учитываемых товаров списываются
+# условными UPDATE (цена берётся из них), заказ вставляется INSERT ... SELECT с проверкой покупателя,
+# позиции - одним многострочным INSERT, всё в одной транзакции. Возвращает None, если покупатель
+# или какой-либо из товаров не найден
+async def create_cart_order(db: AsyncSession, order: schemas.OrderCartCreate, idempotency_key: Optional[str] = None):
+    table = models.Order.__table__
+    items_table = models.OrderItem.__table__
+    customers = models.Customer.__table__
+
+    result = await db.execute(select(models.Product.id, models.Product.price, _stock_tracked()).filter(
+        models.Product.id.in_({item.product_id for item in order.items})))
+    rows = result.tuples().all()
+    prices = {product_id: price for product_id, price, _ in rows}
+    tracked = {product_id for product_id, _, is_tracked in rows if is_tracked}
+    if any(item.product_id not in prices for item in order.items):
+        await db.rollback()
+        return None
+    prices.update(await _reserve_stock(db, _stock_lines(
+        *(item.model_dump() for item in order.items if item.product_id in tracked))))
+
+    values = [dict(product_id=item.product_id, quantity=item.quantity, price=prices[item.product_id],
+                   total_price=prices[item.product_id] * item.quantity) for item in order.items]
+    source = select(
+        literal(order.customer_id, table.c.customer_id.type),
+        literal(sum(value["quantity"] for value in values), table.c.quantity.type),
+        literal(sum(value["total_price"] for value in values), table.c.total_price.type)
+    ).where(select(customers.c.id).where(customers.c.id == order.customer_id).exists())
+    created = {}
+
+    async def on_row(row):
+        result = await db.execute(insert(items_table).returning(*items_table.c, sort_by_parameter_order=True),
+                                  [dict(value, order_id=row["id"], order_created_at=row["created_at"])
+                                   for value in values])
+        created["items"] = result.mappings().all()
+        await _apply_sales(db, [(dict(row, items=created["items"]), 1)])
+        if idempotency_key is not None:
+            await _store_idempotent_response(db, idempotency_key, schemas.OrderWithItems.model_validate(
+                dict(row, items=[dict(item) for item in created["items"]])))
 
+    db_order = await _execute_returning(db, insert(table).from_select(
+        ["customer_id", "quantity", "total_price"], source).returning(*table.c), on_row=on_row)
+    return None if db_order is None else dict(db_order, items=created["items"])
 
+
+# Массовое создание заказов: по одному IN-запросу на покупателей и товары, по одному условному UPDATE
+# на каждый товар с учётом остатка, один многострочный INSERT и один commit
+async def create_orders_bulk(db: AsyncSession, orders: List[schemas.OrderCreate]):
+    customer_ids = {order.customer_id for order in orders}
+    product_ids = {order.product_id for order in orders}
+
+    result = await db.execute(select(models.Customer.id).filter(models.Customer.id.in_(customer_ids)))
+    found_customers = set(result.scalars().all())
+    result = await db.execute(select(models.Product.id, models.Product.price, _stock_tracked()).filter(
+        models.Product.id.in_(product_ids)))
+    rows = result.tuples().all()
+    prices = {product_id: price for product_id, price, _ in rows}
+    tracked = {product_id for product_id, _, is_tracked in rows if is_tracked}
+
+    # Остаток товара списывается сразу на все его заказы. Если на все не хватает, заказы товара списываются
+    # по одному, пока хватает остатка (заказ не меньше уже не поместившегося не проверяется)
+    out_of_stock = set()
+    stocked = [(index, order) for index, order in enumerate(orders)
+               if order.customer_id in found_customers and order.product_id in tracked]
+    for product_id, quantity in sorted(_stock_lines(*(order.model_dump() for _, order in stocked)).items()):
+        row = await _reserve(db, product_id, quantity)
+        if row is not None and row["reserved"]:
+            prices[product_id] = row["price"]
+            continue
+        shortage = None
+        for index, order in stocked:
+            if order.product_id != product_id:
+                continue
+            if shortage is None or order.quantity < shortage:
+                row = await _reserve(db, product_id, order.quantity)
+                if row is not None and row["reserved"]:
+                    prices[product_id] = row["price"]
+                    continue
+                shortage = order.quantity
+            out_of_stock.add(index)
+
+    items = []
+    values = []
+    for index, order in enumerate(orders):
+        if order.customer_id not in found_customers:
+            items.append({"index": index, "detail": "Customer not found"})
+        elif order.product_id not in prices:
+            items.append({"index": index, "detail": "Product not found"})
+        elif index in out_of_stock:
+            items.append({"index": index, "detail": "Insufficient stock"})
+        else:
+            items.append({"index": index})
+            values.append(dict(customer_id=order.customer_id, product_id=order.product_id, quantity=order.quantity,
+                               total_price=prices[order.product_id] * order.quantity))
+
+    if values:
+        table = models.Order.__table__
+        result = await db.execute(insert(table).returning(*table.c, sort_by_parameter_order=True), values)
+        created = result.mappings().all()
+        await _apply_sales(db, [(row, 1) for row in created])
+        created = iter(created)
+        for item in items:
+            if "detail" not in item:
+                item["order"] = next(created)
+        await db.commit()
+    return items
+
+
+# UPDATE ... RETURNING: заказ обновляется, только если существуют заказ, товар и покупатель, цена берётся подзапросом.
+# Прежние значения заказа (old_*) возвращаются тем же запросом для корректировки сводок продаж
 async def update_order(db: AsyncSession, order_id: int, order: schemas.OrderUpdate):
-    product = await db.execute(select(models.Product).filter(models.Product.id == order.product_id))
-    product_price = product.scalars().first().price
-    total_price = product_price * order.quantity
+    table = models.Order.__table__
+    products = models.Product.__table__
+    customers = models.Customer.__table__
+    items = models.OrderItem.__table__
+    price = select(products.c.price).where(products.c.id == order.product_id)
+    previous = None
+    if db.bind.dialect.name == "postgresql":
+        old = select(table).where(table.c.id == order_id).with_for_update().subquery("old")
+        target, old_columns = table.c.id == old.c.id, [old.c[name].label("old_" + name) for name in SALES_COLUMNS]
+    else:
+        # SQLite не возвращает в RETURNING столбцы подзапроса из FROM: прежний заказ читается отдельным запросом
+        result = await db.execute(select(*(table.c[name] for name in SALES_COLUMNS)).where(table.c.id == order_id))
+        previous = result.mappings().first()
+        target, old_columns = table.c.id == order_id, []
 
-    await db.execute(update(models.Order).where(models.Order.id == order_id).values(
+    # Заказ из корзины при обновлении становится обычным заказом: его позиции удаляются в той же транзакции.
+    # Остаток по прежнему заказу возвращается, по новому - списывается
+    async def on_row(row):
+        result = await db.execute(delete(items).where(items.c.order_id == row["id"]).returning(
+            items.c.product_id, items.c.quantity, items.c.total_price))
+        old_items = result.mappings().all()
+        old_order = previous or {name: row["old_" + name] for name in SALES_COLUMNS}
+        await _release_stock(db, _stock_lines(old_order, *old_items))
+        await _reserve_stock(db, _stock_lines(row))
+        await _apply_sales(db, [(dict(old_order, items=old_items), -1), (row, 1)])
+
+    return await _execute_returning(db, update(table).where(
+        target,
+        price.exists(),
+        select(customers.c.id).where(customers.c.id == order.customer_id).exists()
+    ).values(
         customer_id=order.customer_id,
         product_id=order.product_id,
         quantity=order.quantity,
-        total_price=total_price
-    ))
-    await db.commit()
+        total_price=price.scalar_subquery() * order.quantity
+    ).returning(*table.c, *old_columns), on_row=on_row)
 
 
+# Позиции удаляются явно до заказа (а не каскадно), чтобы вернуть их для корректировки сводок продаж и остатков
 async def delete_order(db: AsyncSession, order_id: int):
-    await db.execute(delete(models.Order).where(models.Order.id == order_id))
-    await db.commit()
+    table = models.Order.__table__
+    items = models.OrderItem.__table__
+    result = await db.execute(delete(items).where(items.c.order_id == order_id).returning(
+        items.c.product_id, items.c.quantity, items.c.total_price))
+    deleted_items = result.mappings().all()
+
+    async def on_row(row):
+        await _release_stock(db, _stock_lines(row, *deleted_items))
+        await _apply_sales(db, [(dict(row, items=deleted_items), -1)])
+
+    return await _execute_returning(db, delete(table).where(table.c.id == order_id).returning(*table.c),
+                                    on_row=on_row)
+
+
+# Окно времени создания [created_from, created_to): по нему планировщик исключает секции таблицы заказов
+def _created_window(query, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    if created_from is not None:
+        query = query.filter(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(models.Order.created_at < created_to)
+    return query
+
+
+# Фильтры списка заказов обслуживаются индексами (customer_id, id), (product_id, id) и (total_price, id)
+async def get_orders(db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[tuple] = None,
+                     sort: str = "id", customer_id: Optional[int] = None, product_id: Optional[int] = None,
+                     total_min: Optional[float] = None, total_max: Optional[float] = None,
+                     created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    query = _created_window(select(models.Order.__table__), created_from, created_to)
+    if customer_id is not None:
+        query = query.filter(models.Order.customer_id == customer_id)
+    if product_id is not None:
+        query = query.filter(models.Order.product_id == product_id)
+    if total_min is not None:
+        query = query.filter(models.Order.total_price >= total_min)
+    if total_max is not None:
+        query = query.filter(models.Order.total_price <= total_max)
+    query = _sort_page(query, models.Order, sort, skip, after)
+    result = await db.execute(query.limit(limit))
+    return result.all()
+
+
+# Заказы покупателя по индексу (customer_id, id); товар и позиции подгружаются отдельными запросами только
+# по запросу, без них выбираются строки таблицы
+async def get_customer_orders(db: AsyncSession, customer_id: int, limit: int = 100, after_id: Optional[int] = None,
+                              include_product: bool = False, include_items: bool = False,
+                              created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    if include_product or include_items:
+        product_loader = selectinload(models.Order.product) if include_product else noload(models.Order.product)
+        items_loader = selectinload(models.Order.items) if include_items else noload(models.Order.items)
+        query = lambda_stmt(lambda: select(models.Order).options(product_loader, items_loader))
+    else:
+        query = lambda_stmt(lambda: select(models.Order.__table__))
+    query += lambda s: s.filter(models.Order.customer_id == customer_id)
+    if created_from is not None:
+        query += lambda s: s.filter(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query += lambda s: s.filter(models.Order.created_at < created_to)
+    if after_id is not None:
+        query += lambda s: s.filter(models.Order.id > after_id)
+    query += lambda s: s.order_by(models.Order.id).limit(limit)
+    result = await db.execute(query)
+    return result.scalars().all() if include_product or include_items else result.all()
+
+
+# Заказы по списку id; товар, покупатель и позиции корзины по желанию загружаются через selectinload
+# (по одному дополнительному запросу на связь для всех заказов сразу)
+async def get_orders_by_ids(db: AsyncSession, ids: List[int], include_product: bool = False,
+                            include_customer: bool = False, include_items: bool = False):
+    if not (include_product or include_customer or include_items):
+        return await _get_by_ids(db, select(models.Order.__table__), models.Order.id, ids)
+    query = select(models.Order).options(
+        selectinload(models.Order.product) if include_product else noload(models.Order.product),
+        selectinload(models.Order.customer) if include_customer else noload(models.Order.customer),
+        selectinload(models.Order.items) if include_items else noload(models.Order.items))
+    return await _get_by_ids(db, query, models.Order.id, ids, scalars=True)
+
+
+async def stream_orders(db: AsyncSession, batch_size: int = 1000):
+    result = await db.stream(select(models.Order.__table__).order_by(models.Order.id).execution_options(
+        yield_per=batch_size))
+    async for rows in result.mappings().partitions():
+        yield rows
+
+
+# === Functions for Idempotency Keys ===
+
+# Захват ключа идемпотентности - первый запрос транзакции создания заказа. Параллельный запрос с тем же ключом
+# ждёт на вставке завершения первой транзакции: после её фиксации получает сохранённый ответ, после отмены -
+# захватывает ключ сам. Просроченный ключ захватывается заново. Возвращает None, если ключ захвачен
+# (транзакция остаётся открытой), иначе сохранённую запись (fingerprint и response)
+async def claim_idempotency_key(db: AsyncSession, key: str, fingerprint: str, ttl: float):
+    table = models.IdempotencyKey.__table__
+    statement = pg_insert(table).values(key=key, fingerprint=fingerprint,
+                                        expires_at=func.now() + timedelta(seconds=ttl))
+    result = await db.execute(statement.on_conflict_do_update(index_elements=[table.c.key], set_={
+        "fingerprint": statement.excluded.fingerprint,
+        "response": None,
+        "expires_at": statement.excluded.expires_at
+    }, where=table.c.expires_at < func.now()).returning(table.c.key))
+    if result.first() is not None:
+        return None
+
+    result = await db.execute(select(table.c.fingerprint, table.c.response).where(table.c.key == key))
+    stored = result.mappings().first()
+    await db.rollback()
+    return stored
 
 
-async def get_orders(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(models.Order).offset(skip).limit(limit))
-    return result.scalars().all()
+async def _store_idempotent_response(db: AsyncSession, key: str, response):
+    table = models.IdempotencyKey.__table__
+    await db.execute(update(table).where(table.c.key == key).values(response=response.model_dump(mode="json")))
+
+
+# Удаление просроченных ключей (по индексу expires_at); возвращает число удалённых
+async def delete_expired_idempotency_keys(db: AsyncSession) -> int:
+    table = models.IdempotencyKey.__table__
+    result = await db.execute(delete(table).where(table.c.expires_at < func.now()))
+    await db.commit()
+    return result.rowcount
 
 
 # === Functions for Customers ===
 
 async def get_customer(db: AsyncSession, customer_id: int):
-    result = await db.execute(select(models.Customer).filter(models.Customer.id == customer_id))
+    result = await db.execute(lambda_stmt(lambda: select(models.Customer).filter(models.Customer.id == customer_id)))
     return result.scalars().first()
 
 
@@ -134,27 +822,209 @@ async def get_customer_by_username(db: AsyncSession, username: str):
     return result.scalars().first()
 
 
+# Пароль хешируется до первого запроса к БД, чтобы сессия не держала соединение на время вычисления хеша
 async def create_customer(db: AsyncSession, customer: schemas.CustomerCreate):
-    db_customer = models.Customer(username=customer.username, password=customer.password)
-    db.add(db_customer)
-    await db.commit()
-    await db.refresh(db_customer)
-    return db_customer
+    table = models.Customer.__table__
+    password_hash = await passwords.hash(customer.password)
+    return await _execute_returning(db, pg_insert(table).values(
+        username=customer.username,
+        password=password_hash
+    ).on_conflict_do_nothing(index_elements=[table.c.username]).returning(*table.c))
 
 
 async def update_customer(db: AsyncSession, customer_id: int, customer: schemas.CustomerUpdate):
-    await db.execute(update(models.Customer).where(models.Customer.id == customer_id).values(
+    table = models.Customer.__table__
+    password_hash = await passwords.hash(customer.password)
+    return await _execute_returning(db, update(table).where(table.c.id == customer_id).values(
         username=customer.username,
-        password=customer.password
-    ))
-    await db.commit()
+        password=password_hash
+    ).returning(*table.c))
+
+
+# Проверка пароля покупателя. Транзакция чтения завершается до проверки хеша, чтобы не держать соединение.
+# Если хеш получен с устаревшими параметрами (или пароль хранится без хеширования), он пересчитывается;
+# условие на старый хеш не даёт перезаписать пароль, изменённый параллельно
+async def authenticate_customer(db: AsyncSession, username: str, password: str):
+    table = models.Customer.__table__
+    result = await db.execute(lambda_stmt(lambda: select(table).where(table.c.username == username)))
+    db_customer = result.mappings().first()
+    await db.rollback()
+
+    if not await passwords.verify(db_customer["password"] if db_customer else None, password):
+        return None
+
+    if passwords.needs_rehash(db_customer["password"]):
+        password_hash = await passwords.hash(password)
+        await db.execute(update(table).where(table.c.id == db_customer["id"],
+                                             table.c.password == db_customer["password"]).values(
+            password=password_hash))
+        await db.commit()
+    return db_customer
 
 
 async def delete_customer(db: AsyncSession, customer_id: int):
-    await db.execute(delete(models.Customer).where(models.Customer.id == customer_id))
-    await db.commit()
+    table = models.Customer.__table__
+    return await _execute_returning(db, delete(table).where(table.c.id == customer_id).returning(*table.c))
+
+
+async def get_customers(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    # Пароль в ответах не возвращается, поэтому выбираются только нужные столбцы
+    query = select(models.Customer.id, models.Customer.username).order_by(models.Customer.id)
+    if after_id is not None:
+        query = query.filter(models.Customer.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    return result.all()
+
+
+async def get_customers_by_ids(db: AsyncSession, ids: List[int]):
+    return await _get_by_ids(db, select(models.Customer.id, models.Customer.username), models.Customer.id, ids)
+
 
+# === Functions for warm-up ===
 
-async def get_customers(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(models.Customer).offset(skip).limit(limit))
-    return result.scalars().all()
+# Частые запросы чтения для прогрева соединения: выполняются с несуществующими id, поэтому ничего не находят,
+# но SQLAlchemy компилирует их, а asyncpg готовит на этом соединении. Запросы каталога выполняются напрямую,
+# минуя кэш каталога: прогрев не меняет его содержимое и счётчики промахов. Возвращает число запросов
+async def warm_up_queries(db: AsyncSession) -> int:
+    queries = [
+        db.execute(_catalog_query(models.Category, 0)),
+        db.execute(_version_query(models.Category, 0)),
+        db.execute(_catalog_query(models.Product, 0)),
+        db.execute(_version_query(models.Product, 0)),
+        get_category_products(db, 0, limit=1),
+        get_customer(db, 0),
+        get_order(db, 0),
+        get_orders(db, limit=1),
+        get_customer_orders(db, 0, limit=1),
+    ]
+    for query in queries:
+        await query
+    await db.rollback()
+    return len(queries)
+
+
+# === Functions for Sales summaries ===
+
+SALES_COLUMNS = ("customer_id", "product_id", "quantity", "total_price")
+SALES_ORDER_BY = ("revenue", "units", "orders_count")
+
+
+# Строки продаж заказа по товарам: у обычного заказа - сам заказ, у заказа из корзины - его позиции (items)
+def _sales_lines(order) -> list:
+    return [order] if order["product_id"] is not None else order.get("items", [])
+
+
+# Изменение сводок продаж: changes - список пар (заказ, знак), знак 1 добавляет заказ, -1 вычитает; заказ из корзины
+# передаётся с позициями в items. В сводках товаров и категорий заказ учитывается один раз на товар и на категорию
+# (категория товара читается одним запросом на момент изменения). Выполняется в транзакции изменения заказов
+# одним многострочным upsert на каждую сводку
+async def _apply_sales(db: AsyncSession, changes):
+    product_ids = {line["product_id"] for order, _ in changes for line in _sales_lines(order)}
+    categories = {}
+    if product_ids:
+        result = await db.execute(select(models.Product.id, models.Product.category_id).where(
+            models.Product.id.in_(product_ids)))
+        categories = dict(result.tuples().all())
+
+    deltas = {models.ProductSales: {}, models.CategorySales: {}, models.CustomerSales: {}}
+    for order, sign in changes:
+        totals = {models.ProductSales: {}, models.CategorySales: {},
+                  models.CustomerSales: {order["customer_id"]: [order["quantity"], order["total_price"]]}}
+        for line in _sales_lines(order):
+            for model, key in ((models.ProductSales, line["product_id"]),
+                               (models.CategorySales, categories.get(line["product_id"]))):
+                total = totals[model].setdefault(key, [0, 0.0])
+                total[0] += line["quantity"]
+                total[1] += line["total_price"]
+        for model, keys in totals.items():
+            for key, (units, revenue) in keys.items():
+                if key is None:
+                    continue
+                delta = deltas[model].setdefault(key, [0, 0, 0.0])
+                delta[0] += sign
+                delta[1] += sign * units
+                delta[2] += sign * revenue
+
+    for model, rows in deltas.items():
+        if not rows:
+            continue
+        table = model.__table__
+        key_column = table.primary_key.columns[0]
+        # Ключи сортируются, чтобы параллельные транзакции блокировали строки сводок в одном порядке
+        statement = pg_insert(table).values([
+            {key_column.name: key, "orders_count": count, "units": units, "revenue": revenue}
+            for key, (count, units, revenue) in sorted(rows.items())
+        ])
+        await db.execute(statement.on_conflict_do_update(index_elements=[key_column], set_={
+            name: table.c[name] + statement.excluded[name] for name in ("orders_count", "units", "revenue")
+        }))
+
+
+async def get_product_sales(db: AsyncSession, limit: int = 10, order_by: str = "revenue"):
+    sales = models.ProductSales
+    result = await db.execute(
+        select(sales.product_id.label("id"), models.Product.name, sales.orders_count, sales.units, sales.revenue)
+        .join(models.Product, models.Product.id == sales.product_id)
+        .where(sales.orders_count > 0)
+        .order_by(getattr(sales, order_by).desc(), sales.product_id)
+        .limit(limit))
+    return result.mappings().all()
+
+
+# Сводка по категориям ведётся отдельно от сводок товаров: заказ с несколькими товарами одной категории
+# учитывается в ней один раз. При переносе товара в другую категорию сводки пересчитываются командой rebuild-sales
+async def get_category_sales(db: AsyncSession, limit: int = 10, order_by: str = "revenue"):
+    sales = models.CategorySales
+    result = await db.execute(
+        select(sales.category_id.label("id"), models.Category.name, sales.orders_count, sales.units, sales.revenue)
+        .join(models.Category, models.Category.id == sales.category_id)
+        .where(sales.orders_count > 0)
+        .order_by(getattr(sales, order_by).desc(), sales.category_id)
+        .limit(limit))
+    return result.mappings().all()
+
+
+async def get_customer_sales(db: AsyncSession, limit: int = 10, order_by: str = "revenue"):
+    sales = models.CustomerSales
+    result = await db.execute(
+        select(sales.customer_id.label("id"), models.Customer.username.label("name"), sales.orders_count,
+               sales.units, sales.revenue)
+        .join(models.Customer, models.Customer.id == sales.customer_id)
+        .where(sales.orders_count > 0)
+        .order_by(getattr(sales, order_by).desc(), sales.customer_id)
+        .limit(limit))
+    return result.mappings().all()
+
+
+# Полный пересчёт сводок по таблице заказов (запись в заказы на время пересчёта блокируется)
+async def rebuild_sales_summaries(db: AsyncSession):
+    orders = models.Order.__table__
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("LOCK TABLE orders, order_items IN SHARE MODE"))
+    # Продажи товаров складываются из обычных заказов и позиций заказов из корзины (у них product_id заказа пустой)
+    items = models.OrderItem.__table__
+    product_lines = select(orders.c.product_id, orders.c.id.label("order_id"), orders.c.quantity,
+                           orders.c.total_price).where(orders.c.product_id.isnot(None)).union_all(
+        select(items.c.product_id, items.c.order_id, items.c.quantity, items.c.total_price)).subquery("lines")
+    products = models.Product.__table__
+    category_lines = select(products.c.category_id, product_lines.c.order_id, product_lines.c.quantity,
+                            product_lines.c.total_price).join(
+        products, products.c.id == product_lines.c.product_id).subquery("category_lines")
+    sources = (
+        (models.ProductSales, product_lines.c.product_id, func.count(product_lines.c.order_id.distinct()),
+         product_lines),
+        (models.CategorySales, category_lines.c.category_id, func.count(category_lines.c.order_id.distinct()),
+         category_lines),
+        (models.CustomerSales, orders.c.customer_id, func.count(), orders),
+    )
+    for model, key, orders_count, source in sources:
+        table = model.__table__
+        await db.execute(delete(table))
+        await db.execute(insert(table).from_select(
+            [table.primary_key.columns[0].name, "orders_count", "units", "revenue"],
+            select(key, orders_count, func.sum(source.c.quantity), func.sum(source.c.total_price))
+            .where(key.isnot(None))
+            .group_by(key)))
+    await db.commit()
@@ -0,0 +1,70 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+from app.serialization import fast_response
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+# ETag записи каталога строится из версии строки и времени изменения (на случай повторного использования id),
+# поэтому для условного запроса достаточно прочитать эти два столбца
+def resource_etag(item) -> str:
+    return f'"{item.version}-{(_utc(item.updated_at) - EPOCH) // timedelta(microseconds=1):x}"'
+
+
+# ETag списка - хеш от ETag всех записей страницы (и связанных записей, включённых в ответ) и курсора;
+# вычисляется до сериализации ответа
+def list_etag(items: Iterable, *extra) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for item in items:
+        digest.update(f"{item.id}:{resource_etag(item)};".encode())
+    for part in extra:
+        digest.update(f"{part};".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def last_modified(items: Iterable) -> Optional[datetime]:
+    return max((_utc(item.updated_at) for item in items), default=None)
+
+
+# If-None-Match сравнивается слабым сравнением (префикс W/ не учитывается), '*' совпадает с любой версией
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def set_validators(response: Response, etag: str, modified: Optional[datetime] = None):
+    response.headers["ETag"] = etag
+    if modified is not None:
+        response.headers["Last-Modified"] = format_datetime(_utc(modified), usegmt=True)
+
+
+# Ответ 304 (Not Modified) без тела, с теми же валидаторами, что и полный ответ
+def not_modified(etag: str, modified: Optional[datetime] = None) -> Response:
+    response = Response(status_code=304)
+    set_validators(response, etag, modified)
+    return response
+
+
+# Ответ со списком записей каталога: ETag вычисляется по версиям записей до сериализации,
+# при совпадении с If-None-Match возвращается 304 без сериализации тела
+def conditional_list_response(request: Request, response_type, content, items, *extra) -> Response:
+    etag = list_etag(items, *extra)
+    modified = last_modified(items)
+    if is_not_modified(request, etag):
+        return not_modified(etag, modified)
+    response = fast_response(response_type, content)
+    set_validators(response, etag, modified)
+    return response
@@ -0,0 +1,50 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from fastapi.responses import StreamingResponse
+
+from app.database import read_sessionmaker
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return "".join(json.dumps(dict(row), default=json_default) + "\n" for row in rows).encode()
+
+
+def _csv_chunk(rows, header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(rows[0].keys())
+    writer.writerows(row.values() for row in rows)
+    return buffer.getvalue().encode()
+
+
+# Выгрузка идёт через серверный курсор пачками по batch_size строк, поэтому память не растёт с размером таблицы.
+# Сессия (к реплике, если они настроены) открывается внутри генератора: сессия из get_db закрывается до того,
+# как начнёт отправляться тело ответа
+def streaming_export(stream_rows, export_format: str, filename: str, batch_size: int = 1000) -> StreamingResponse:
+    async def body():
+        async with read_sessionmaker()() as session:
+            first = True
+            async for rows in stream_rows(session, batch_size=batch_size):
+                if export_format == "csv":
+                    yield _csv_chunk(rows, header=first)
+                else:
+                    yield _ndjson_chunk(rows)
+                first = False
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'})
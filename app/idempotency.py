@@ -0,0 +1,23 @@
+import hashlib
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.config import get_idempotency_key_ttl
+
+IDEMPOTENCY_KEY_TTL = get_idempotency_key_ttl()
+
+
+# Отпечаток запроса: маршрут и тело в каноническом виде (после разбора схемой), поэтому порядок полей
+# и пробелы в JSON клиента не влияют на сравнение
+def request_fingerprint(route: str, payload: BaseModel) -> str:
+    return hashlib.sha256(f"{route}\n{payload.model_dump_json()}".encode()).hexdigest()
+
+
+# Повтор запроса с уже использованным ключом: возвращается сохранённый ответ без обращения к таблицам заказов.
+# Ключ, использованный для другого запроса, - ошибка 422 (Unprocessable Entity)
+def replay_response(stored, fingerprint: str) -> JSONResponse:
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key is already used for a different request")
+    return JSONResponse(stored["response"], headers={"Idempotent-Replayed": "true"})
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import uuid
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, schemas
+from app.cache import MemoryBackend
+from app.config import IngestSettings, load_ingest_settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# Очередь приёма заказов в памяти процесса. Обработчик запроса только проверяет заказ и ставит его в очередь,
+# фоновые обработчики забирают заказы пакетами (batch_size заказов или всё, что пришло за flush_interval секунд)
+# и записывают каждый пакет через crud.create_orders_bulk: несколько запросов и один commit на пакет.
+# Заполненная очередь отклоняет новые заказы (asyncio.QueueFull). Статусы хранятся в памяти процесса,
+# поэтому опрашивать статус нужно у того же процесса; заказы, не записанные до остановки процесса, теряются
+class OrderIngestQueue:
+    def __init__(self, settings: IngestSettings, sessionmaker=SessionLocal):
+        self.settings = settings
+        self.sessionmaker = sessionmaker
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._statuses = MemoryBackend(max_size=settings.status_size, ttl=settings.status_ttl)
+        self.batches = 0
+        self.orders = 0
+
+    # Очередь и обработчики создаются в работающем цикле событий при первом заказе
+    def _start(self):
+        self._queue = asyncio.Queue(self.settings.queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.settings.workers)]
+
+    async def submit(self, order: schemas.OrderCreate) -> dict:
+        if self._queue is None:
+            self._start()
+        status = {"tracking_id": uuid.uuid4().hex, "status": "queued"}
+        self._queue.put_nowait((status["tracking_id"], order))
+        await self._statuses.set(status["tracking_id"], status)
+        return status
+
+    async def status(self, tracking_id: str) -> Optional[dict]:
+        return await self._statuses.get(tracking_id)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.settings.flush_interval
+            while len(batch) < self.settings.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        try:
+            async with self.sessionmaker() as db:
+                results = await crud.create_orders_bulk(db, [order for _, order in batch])
+        except IntegrityError:
+            # Покупатель или товар удалены параллельно: пакет отменён целиком, поэтому заказы записываются по одному,
+            # чтобы ошибка одного заказа не отменила остальные
+            if len(batch) > 1:
+                for item in batch:
+                    await self._flush([item])
+                return
+            results = [{"detail": "Customer or product not found"}]
+        except Exception:
+            logger.exception("Order ingest batch of %d orders failed", len(batch))
+            results = [{"detail": "Internal error"}] * len(batch)
+
+        self.batches += 1
+        for (tracking_id, _), result in zip(batch, results):
+            if "order" in result:
+                self.orders += 1
+                order = schemas.Order.model_validate(dict(result["order"])).model_dump(mode="json")
+                status = {"tracking_id": tracking_id, "status": "created", "order": order}
+            else:
+                status = {"tracking_id": tracking_id, "status": "failed", "detail": result["detail"]}
+            await self._statuses.set(tracking_id, status)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.settings.queue_size,
+            "batch_size": self.settings.batch_size,
+            "batches": self.batches,
+            "orders": self.orders,
+        }
+
+    # Остановка: дожидаемся записи уже принятых заказов и останавливаем обработчики
+    async def close(self):
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queue = None
+
+
+order_queue = OrderIngestQueue(load_ingest_settings())
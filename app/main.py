@@ -1,17 +1,80 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Literal, Optional, Union
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud, models, schemas
-from app.database import SessionLocal, engine
+from app.bulk_import import import_rows
+from app.etag import conditional_list_response, is_not_modified, not_modified, resource_etag, set_validators
+from app.export import streaming_export
+from app.ingest import order_queue
+from app.idempotency import IDEMPOTENCY_KEY_TTL, replay_response, request_fingerprint
+from app.metrics import RequestMetrics, current_request_metrics, registry
+from app.partitions import check_order_partitions, run_partition_job
+from app.pagination import decode_cursor, decode_sort_cursor, make_page
+from app.serialization import fast_response
+from app.warmup import warm_up, warmup_stats
+from app.database import (SessionReleasingRoute, engine, engine_settings, get_db, get_read_db, is_read_only_route,
+                          pin_to_primary, pool_stats, release_session)
 
 from fastapi import Depends, HTTPException, status
 
-app = FastAPI()
-
-
-# Зависимость
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+# При запуске соединения пула прогреваются частыми запросами, а (только PostgreSQL) создаются недостающие секции
+# заказов по месяцам - до приёма запросов, чтобы заказы не попадали в секцию по умолчанию, - и стартует задача,
+# которая создаёт их дальше. При остановке приложения дожидаемся записи заказов, уже принятых в очередь приёма
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up()
+    partition_job = None
+    if engine.dialect.name == "postgresql":
+        await check_order_partitions()
+        partition_job = asyncio.create_task(run_partition_job())
+    yield
+    if partition_job is not None:
+        partition_job.cancel()
+        await asyncio.gather(partition_job, return_exceptions=True)
+    await order_queue.close()
+
+
+app = FastAPI(lifespan=lifespan)
+# В режиме release обработчики возвращают соединение в пул до сериализации ответа (маршруты регистрируются ниже)
+if engine_settings.session_mode == "release":
+    app.router.route_class = SessionReleasingRoute
+
+
+# После успешной записи клиент на время закрепляется за основной БД (чтение своих записей при отставании реплик).
+# POST-маршруты только на чтение (выборки по списку id) клиента не закрепляют
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    response = await call_next(request)
+    if (request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400
+            and not is_read_only_route(request.scope.get("route"))):
+        pin_to_primary(response)
+    return response
+
+
+# Сбор метрик: задержка и статус по шаблону маршрута, число SQL-запросов и время SQL за запрос
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    request_metrics = RequestMetrics()
+    token = current_request_metrics.set(request_metrics)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        current_request_metrics.reset(token)
+        # Несовпавшие пути объединяются в одну метку, чтобы не раздувать число временных рядов
+        route = request.scope.get("route")
+        registry.observe_request(request.method, route.path if route else "unmatched", status_code,
+                                 time.perf_counter() - start, request_metrics)
 
 
 # --- Обработка маршрутов сущности "categories" ---
@@ -19,19 +82,25 @@ async def get_db():
 # Асинхронная функция 'create_category' используется для создания новой категории
 @app.post("/categories/", response_model=schemas.Category)
 async def create_category(category: schemas.CategoryCreate, db: AsyncSession = Depends(get_db)):
-    # Проверяем, существует ли категория с таким же именем
-    db_category = await crud.get_category_by_name(db, name=category.name)
-    if db_category:
+    # Создаем новую категорию (INSERT ... ON CONFLICT DO NOTHING)
+    db_category = await crud.create_category(db, category)
+    if db_category is None:
         # Если категория уже существует, возвращаем ошибку с кодом 400 (Bad Request)
         raise HTTPException(status_code=400, detail="Category already registered")
 
-    # Создаем новую категорию
-    return await crud.create_category(db, category)
+    return db_category
 
 
 # Асинхронная функция 'read_category' используется для чтения информации о категории по ID
 @app.get("/categories/{category_id}", response_model=schemas.Category)
-async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
+async def read_category(category_id: int, request: Request, response: Response,
+                        db: AsyncSession = Depends(get_read_db)):
+    # Условный запрос: сравниваем ETag по версии категории, не загружая и не сериализуя её целиком
+    if request.headers.get("if-none-match"):
+        version = await crud.get_category_version(db, category_id)
+        if version is not None and is_not_modified(request, resource_etag(version)):
+            return not_modified(resource_etag(version), version.updated_at)
+
     # Получение категории из базы данных по ID
     db_category = await crud.get_category(db, category_id)
     if db_category is None:
@@ -39,46 +108,92 @@ async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Category not found")
 
     # Возвращаем информацию о категории
+    set_validators(response, resource_etag(db_category), db_category.updated_at)
     return db_category
 
 
 # Асинхронная функция 'update_category' используется для обновления информации о категории по ID
 @app.put("/categories/{category_id}", response_model=schemas.Category)
 async def update_category(category_id: int, category: schemas.CategoryUpdate, db: AsyncSession = Depends(get_db)):
-    # Проверка на наличие другой категории с таким же именем в базе данных
-    db_category = await crud.get_category_by_name(db, name=category.name)
-    if db_category:
+    # Обновление категории с помощью crud функции (UPDATE ... RETURNING)
+    try:
+        db_category = await crud.update_category(db, category_id, category)
+    except IntegrityError:
         # Если категория с таким именем уже существует, вызываем исключение 400 (Bad Request)
         raise HTTPException(status_code=400, detail="Category already registered")
 
-    # Обновление категории с помощью crud функции
-    await crud.update_category(db, category_id, category)
+    if db_category is None:
+        # Если категория не найдена, вызываем исключение 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Category not found")
 
-    # Получаем обновленную категорию из базы данных
-    return await crud.get_category(db, category_id)
+    # Возвращаем обновленную категорию
+    return db_category
 
 
 # Асинхронная функция 'delete_category' используется для удаления информации о категории по ID
 @app.delete("/categories/{category_id}", response_model=schemas.Category)
 async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
-    # Попытка получения категории из базы данных по её ID
-    db_category = await crud.get_category(db, category_id)
+    # Удаление категории одним запросом (DELETE ... RETURNING), без отдельного чтения в той же транзакции
+    db_category = await crud.delete_category(db, category_id)
     if db_category is None:
         # Если категория не найдена, вызываем исключение 404 (Not Found)
         raise HTTPException(status_code=404, detail="Category not found")
 
-    # Удаление категории через crud функцию
-    await crud.delete_category(db, category_id)
-
     # Возвращаем информацию об удалённой категории
     return db_category
 
 
+# Асинхронная функция 'import_categories' используется для массовой загрузки категорий из CSV или NDJSON
+# (тело запроса читается потоком и передаётся в БД через COPY)
+@app.post("/categories/import", response_model=schemas.ImportReport)
+async def import_categories(request: Request, db: AsyncSession = Depends(get_db),
+                            import_format: Literal["csv", "ndjson"] = Query("csv", alias="format")):
+    return await import_rows(db, "categories", request.stream(), import_format)
+
+
+# Асинхронная функция 'read_categories_batch' используется для чтения категорий по списку ID одним запросом
+# к БД: записи возвращаются в порядке запрошенных ID, отсутствующие ID перечисляются в поле missing
+@app.post("/categories/batch", response_model=schemas.Batch[schemas.Category])
+async def read_categories_batch(batch: schemas.BatchRequest, db: AsyncSession = Depends(get_read_db)):
+    items, missing = await crud.get_categories_by_ids(db, batch.ids)
+    await release_session(db)
+    return fast_response(schemas.Batch[schemas.Category], {"items": items, "missing": missing})
+
+
 # Асинхронная функция 'read_categories' используется для чтения информации о всех категориях в базе данных
-@app.get("/categories/", response_model=list[schemas.Category])
-async def read_categories(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Получение списка категорий из базы данных с применением параметров пагинации
-    return await crud.get_categories(db, skip=skip, limit=limit)
+@app.get("/categories/", response_model=Union[list[schemas.Category], schemas.Page[schemas.Category]])
+async def read_categories(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                          db: AsyncSession = Depends(get_read_db)):
+    if cursor is None:
+        # Получение списка категорий из базы данных с применением параметров пагинации
+        items = await crud.get_categories(db, skip=skip, limit=limit)
+        await release_session(db)
+        return conditional_list_response(request, list[schemas.Category], items, items)
+
+    # Курсорная пагинация: выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_categories(db, limit=limit + 1, after_id=decode_cursor(cursor))
+    await release_session(db)
+    page = make_page(items, limit)
+    return conditional_list_response(request, schemas.Page[schemas.Category], page, page["items"], page["next_cursor"])
+
+
+# Асинхронная функция 'read_category_products' используется для чтения товаров категории с курсорной пагинацией
+@app.get("/categories/{category_id}/products", response_model=schemas.Page[schemas.ProductWithCategory])
+async def read_category_products(category_id: int, request: Request, limit: int = 100, cursor: Optional[str] = None,
+                                 include_category: bool = False, db: AsyncSession = Depends(get_read_db)):
+    # Выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_category_products(db, category_id, limit=limit + 1, after_id=decode_cursor(cursor or ""),
+                                             include_category=include_category)
+    if not items and await crud.get_category(db, category_id) is None:
+        # Если категория не найдена, вызываем исключение HTTP 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    page = make_page(items, limit)
+    # Включённая в ответ категория тоже влияет на ETag
+    category = await crud.get_category_version(db, category_id) if include_category and items else None
+    await release_session(db)
+    return conditional_list_response(request, schemas.Page[schemas.ProductWithCategory], page, page["items"],
+                                     page["next_cursor"], category and resource_etag(category))
 
 
 # --- Обработка маршрутов сущности "products" ---
@@ -86,24 +201,64 @@ async def read_categories(skip: int = 0, limit: int = 100, db: AsyncSession = De
 # Асинхронная функция 'create_product' используется для создания нового продукта
 @app.post("/products/", response_model=schemas.Product)
 async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
-    # Проверяем, существует ли продукт с таким же именем
-    db_product = await crud.get_product_by_name(db, product_name=product.name)
-    if db_product:
+    # Создаем новый продукт (INSERT ... SELECT, только если продукта с таким именем нет)
+    try:
+        db_product = await crud.create_product(db, product)
+    except IntegrityError:
+        # Если категория не найдена (нарушение внешнего ключа), возвращаем ошибку с кодом 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    if db_product is None:
         # Если продукт уже существует, возвращаем ошибку с кодом 400 (Bad Request)
         raise HTTPException(status_code=400, detail="Product already registered")
 
-    db_category = await crud.get_category(db, category_id=product.category_id)
-    if db_category is None:
-        # Если продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
-        raise HTTPException(status_code=404, detail="Category not found")
+    return db_product
+
+
+# Асинхронная функция 'search_products' используется для ранжированного поиска продуктов по имени и описанию
+# с учётом опечаток (маршрут объявлен до '/products/{id}')
+@app.get("/products/search", response_model=list[schemas.Product])
+async def search_products(q: str = Query(..., min_length=1, max_length=200), category_id: Optional[int] = None,
+                          limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_read_db)):
+    items = await crud.search_products(db, q, category_id=category_id, limit=limit)
+    await release_session(db)
+    return fast_response(list[schemas.Product], items)
 
-    # Создаем новый продукт
-    return await crud.create_product(db, product)
+
+# Асинхронная функция 'import_products' используется для массовой загрузки товаров из CSV или NDJSON
+# (тело запроса читается потоком и передаётся в БД через COPY)
+@app.post("/products/import", response_model=schemas.ImportReport)
+async def import_products(request: Request, db: AsyncSession = Depends(get_db),
+                          import_format: Literal["csv", "ndjson"] = Query("csv", alias="format")):
+    return await import_rows(db, "products", request.stream(), import_format)
+
+
+# Асинхронная функция 'read_products_batch' используется для чтения продуктов по списку ID одним запросом
+# к БД: записи возвращаются в порядке запрошенных ID, отсутствующие ID перечисляются в поле missing
+@app.post("/products/batch", response_model=schemas.Batch[schemas.Product])
+async def read_products_batch(batch: schemas.BatchRequest, db: AsyncSession = Depends(get_read_db)):
+    items, missing = await crud.get_products_by_ids(db, batch.ids)
+    await release_session(db)
+    return fast_response(schemas.Batch[schemas.Product], {"items": items, "missing": missing})
+
+
+# Асинхронная функция 'export_products' используется для потоковой выгрузки всех продуктов в формате NDJSON или CSV
+# (маршрут объявлен до '/products/{id}', чтобы 'export' не разбирался как ID)
+@app.get("/products/export")
+async def export_products(export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format")):
+    return streaming_export(crud.stream_products, export_format, filename="products")
 
 
 # Асинхронная функция 'read_product' используется для чтения информации о продукте по ID
 @app.get("/products/{product_id}", response_model=schemas.Product)
-async def read_product(product_id: int, db: AsyncSession = Depends(get_db)):
+async def read_product(product_id: int, request: Request, response: Response,
+                       db: AsyncSession = Depends(get_read_db)):
+    # Условный запрос: сравниваем ETag по версии продукта, не загружая и не сериализуя его целиком
+    if request.headers.get("if-none-match"):
+        version = await crud.get_product_version(db, product_id)
+        if version is not None and is_not_modified(request, resource_etag(version)):
+            return not_modified(resource_etag(version), version.updated_at)
+
     # Получение продукта из базы данных по ID
     db_product = await crud.get_product(db, product_id)
     if db_product is None:
@@ -111,73 +266,220 @@ async def read_product(product_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Возвращаем информацию о категории
+    set_validators(response, resource_etag(db_product), db_product.updated_at)
     return db_product
 
 
 # Асинхронная функция 'update_product' используется для обновления информации о продукте по ID
 @app.put("/products/{product_id}", response_model=schemas.Product)
 async def update_product(product_id: int, product: schemas.ProductUpdate, db: AsyncSession = Depends(get_db)):
-    # Проверка на наличие другого продукта с таким же именем в базе данных
-    db_product = await crud.get_product_by_name(db, product_name=product.name)
-    if db_product and db_product.id != product_id:
-        # Если категория с таким именем уже существует, вызываем исключение HTTP 400 (Bad Request)
-        raise HTTPException(status_code=400, detail="Product already registered")
+    # Обновление продукта с помощью crud функций (UPDATE ... RETURNING)
+    try:
+        db_product = await crud.update_product(db, product_id, product)
+    except IntegrityError:
+        # Если категория не найдена (нарушение внешнего ключа), возвращаем ошибку с кодом 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Category not found")
 
-    # Получаем продукт из базы данных по ID
-    db_product = await crud.get_product(db, product_id=product_id)
     if db_product is None:
-        # Если продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
-        raise HTTPException(status_code=404, detail="Customer not found")
+        # Продукт не обновлён - выясняем причину (дополнительный запрос только в случае ошибки)
+        db_product = await crud.get_product_by_name(db, product_name=product.name)
+        if db_product and db_product.id != product_id:
+            # Если продукт с таким именем уже существует, вызываем исключение HTTP 400 (Bad Request)
+            raise HTTPException(status_code=400, detail="Product already registered")
+
+        # Иначе продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Product not found")
 
-    # Обновление продукта с помощью crud функций
-    await crud.update_product(db, product_id, product)
     # Возвращаем обновленный продукт
-    return await crud.get_product(db, product_id)
+    return db_product
 
 
 # Асинхронная функция 'delete_product' используется для удаления информации о продукте по ID
 @app.delete("/products/{product_id}", response_model=schemas.Product)
 async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
-    # Получаем продукт из базы данных по ID
-    db_product = await crud.get_product(db, product_id)
+    # Удаление продукта одним запросом (DELETE ... RETURNING)
+    db_product = await crud.delete_product(db, product_id)
     if db_product is None:
         # Если продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Удаление продукта через crud функцию
-    await crud.delete_product(db, product_id)
     # Возвращаем информацию о продукте
     return db_product
 
 
-# Асинхронная функция 'read_products' используется для чтения информации о всех продуктах в базе данных
-@app.get("/products/", response_model=list[schemas.Product])
-async def read_products(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Получение списка продуктов из базы данных с применением параметров пагинации
-    return await crud.get_products(db, skip=skip, limit=limit)
+# Асинхронная функция 'read_product_stock' используется для чтения остатка продукта на складе
+# (читается с основной БД: остаток меняется с каждым заказом)
+@app.get("/products/{product_id}/stock", response_model=schemas.ProductStock)
+async def read_product_stock(product_id: int, db: AsyncSession = Depends(get_db)):
+    db_stock = await crud.get_product_stock(db, product_id)
+    if db_stock is None:
+        # Если продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_stock
+
+
+# Асинхронная функция 'update_product_stock' используется для установки остатка продукта и режима его учёта:
+# stock пустой - остаток не учитывается, shards > 0 - остаток делится на части для одновременных покупок
+@app.put("/products/{product_id}/stock", response_model=schemas.ProductStock)
+async def update_product_stock(product_id: int, stock: schemas.ProductStockUpdate, db: AsyncSession = Depends(get_db)):
+    if stock.shards and stock.stock is None:
+        # Делить на части можно только учитываемый остаток
+        raise HTTPException(status_code=400, detail="Stock is required when shards are set")
+
+    db_stock = await crud.set_product_stock(db, product_id, stock)
+    if db_stock is None:
+        # Если продукт не найден, возвращаем ошибку с кодом 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_stock
+
+
+# Асинхронная функция 'read_products' используется для чтения информации о всех продуктах в базе данных.
+# Фильтры и сортировка выполняются в БД; sort - имя поля, '-' в начале - по убыванию
+@app.get("/products/", response_model=Union[list[schemas.Product], schemas.Page[schemas.Product]])
+async def read_products(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                        category_id: Optional[int] = None, price_min: Optional[float] = None,
+                        price_max: Optional[float] = None, name_prefix: Optional[str] = Query(None, max_length=200),
+                        sort: Literal["id", "-id", "price", "-price", "name", "-name"] = "id",
+                        db: AsyncSession = Depends(get_read_db)):
+    filters = dict(sort=sort, category_id=category_id, price_min=price_min, price_max=price_max,
+                   name_prefix=name_prefix)
+    if cursor is None:
+        # Получение списка продуктов из базы данных с применением параметров пагинации
+        items = await crud.get_products(db, skip=skip, limit=limit, **filters)
+        await release_session(db)
+        return conditional_list_response(request, list[schemas.Product], items, items)
+
+    # Курсорная пагинация: выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_products(db, limit=limit + 1, after=decode_sort_cursor(cursor, sort), **filters)
+    await release_session(db)
+    page = make_page(items, limit, sort)
+    return conditional_list_response(request, schemas.Page[schemas.Product], page, page["items"], page["next_cursor"])
 
 
 # --- Обработка маршрутов сущности "order" ---
 
 # Асинхронная функция 'create_order' используется для создания нового заказа
+# (с заголовком Idempotency-Key повтор запроса возвращает сохранённый ответ и не создаёт второй заказ)
 @app.post("/orders/", response_model=schemas.Order)
-async def create_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_db)):
-    # Проверяем по ID, существует ли пользователь
-    db_customer = await crud.get_customer(db, order.customer_id)
-    # Проверяем по ID, существует ли продукт
-    db_product = await crud.get_product(db, order.product_id)
-    if (db_customer is None) or (db_product is None):
+async def create_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_db),
+                       idempotency_key: Optional[str] = Header(None, max_length=255)):
+    if idempotency_key is not None:
+        # Захватываем ключ; если запрос с этим ключом уже выполнен, возвращаем его ответ
+        fingerprint = request_fingerprint("POST /orders/", order)
+        stored = await crud.claim_idempotency_key(db, idempotency_key, fingerprint, IDEMPOTENCY_KEY_TTL)
+        if stored is not None:
+            return replay_response(stored, fingerprint)
+
+    # Создаем новый заказ (списание остатка условным UPDATE, затем INSERT ... SELECT с проверкой покупателя)
+    try:
+        db_order = await crud.create_order(db, order, idempotency_key)
+    except crud.InsufficientStock:
+        # Если остатка товара не хватает, возвращаем ошибку с кодом 409 (Conflict)
+        raise HTTPException(status_code=409, detail="Insufficient stock")
+    except IntegrityError:
+        # Покупатель или товар удалены параллельно - обрабатываем так же, как их отсутствие
+        db_order = None
+
+    if db_order is None:
+        # Заказ не создан - выясняем причину (дополнительные запросы только в случае ошибки)
+        db_customer = await crud.get_customer(db, order.customer_id)
+        db_product = await crud.get_product(db, order.product_id)
+        if (db_customer is None) or (db_product is None):
+            # Если продукт или пользователь не найден, возвращаем ошибку с кодом 404 (Not Found)
+            error = "Customer not found" if db_customer is None else "Product not found"
+            raise HTTPException(status_code=404, detail=error)
+
+    return db_order
+
+
+# Асинхронная функция 'create_orders_bulk' используется для создания списка заказов за один запрос.
+# Ошибки возвращаются по каждому заказу отдельно, корректные заказы создаются в одной транзакции.
+# Список длиннее 1000 заказов отклоняется с кодом 422
+@app.post("/orders/bulk", response_model=list[schemas.OrderBulkItem])
+async def create_orders_bulk(orders: schemas.OrderBulkCreate, db: AsyncSession = Depends(get_db)):
+    if not orders:
+        return []
+
+    # Создаем заказы
+    return await crud.create_orders_bulk(db, orders)
+
+
+# Асинхронная функция 'ingest_order' используется для приёма заказа в очередь: заказ проверяется и сразу
+# возвращается ответ 202 (Accepted) с номером для отслеживания, запись выполняется пакетами в фоне
+@app.post("/orders/ingest", response_model=schemas.OrderIngestStatus, status_code=202)
+async def ingest_order(order: schemas.OrderCreate):
+    try:
+        return await order_queue.submit(order)
+    except asyncio.QueueFull:
+        # Если очередь заполнена, возвращаем ошибку с кодом 503 (Service Unavailable)
+        raise HTTPException(status_code=503, detail="Order queue is full", headers={"Retry-After": "1"})
+
+
+# Асинхронная функция 'read_ingest_status' используется для опроса статуса заказа, принятого в очередь
+@app.get("/orders/ingest/{tracking_id}", response_model=schemas.OrderIngestStatus)
+async def read_ingest_status(tracking_id: str):
+    status = await order_queue.status(tracking_id)
+    if status is None:
+        # Если номер не найден (или статус уже удалён по времени хранения), возвращаем ошибку 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Tracking id not found")
+    return status
+
+
+# Асинхронная функция 'create_cart_order' используется для создания заказа из корзины (нескольких позиций)
+# одним запросом и одной транзакцией
+@app.post("/orders/cart", response_model=schemas.OrderWithItems)
+async def create_cart_order(order: schemas.OrderCartCreate, db: AsyncSession = Depends(get_db),
+                            idempotency_key: Optional[str] = Header(None, max_length=255)):
+    if idempotency_key is not None:
+        # Захватываем ключ; если запрос с этим ключом уже выполнен, возвращаем его ответ
+        fingerprint = request_fingerprint("POST /orders/cart", order)
+        stored = await crud.claim_idempotency_key(db, idempotency_key, fingerprint, IDEMPOTENCY_KEY_TTL)
+        if stored is not None:
+            return replay_response(stored, fingerprint)
+
+    # Создаем заказ и его позиции (цены всех товаров загружаются одним запросом)
+    try:
+        db_order = await crud.create_cart_order(db, order, idempotency_key)
+    except crud.InsufficientStock as error:
+        # Если остатка какого-либо товара не хватает, возвращаем ошибку с кодом 409 (Conflict)
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for product {error.product_id}")
+    except IntegrityError:
+        # Покупатель или товар удалены параллельно - обрабатываем так же, как их отсутствие
+        db_order = None
+
+    if db_order is None:
+        # Заказ не создан - выясняем причину (дополнительный запрос только в случае ошибки)
+        db_customer = await crud.get_customer(db, order.customer_id)
         # Если продукт или пользователь не найден, возвращаем ошибку с кодом 404 (Not Found)
         error = "Customer not found" if db_customer is None else "Product not found"
         raise HTTPException(status_code=404, detail=error)
 
-    # Создаем новый заказ
-    return await crud.create_order(db, order)
+    return db_order
+
+
+# Асинхронная функция 'export_orders' используется для потоковой выгрузки всех заказов в формате NDJSON или CSV
+# (маршрут объявлен до '/orders/{id}', чтобы 'export' не разбирался как ID)
+@app.get("/orders/export")
+async def export_orders(export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format")):
+    return streaming_export(crud.stream_orders, export_format, filename="orders")
+
+
+# Асинхронная функция 'read_orders_batch' используется для чтения заказов по списку ID одним запросом к БД
+# (например, для списка заказов вместо запроса на каждый заказ). Товар, покупатель и позиции корзины по желанию
+# встраиваются в ответ; отсутствующие ID перечисляются в поле missing
+@app.post("/orders/batch", response_model=Union[schemas.Batch[schemas.Order], schemas.Batch[schemas.OrderWithCustomer]])
+async def read_orders_batch(batch: schemas.BatchRequest, include_product: bool = False, include_customer: bool = False,
+                            include_items: bool = False, db: AsyncSession = Depends(get_read_db)):
+    items, missing = await crud.get_orders_by_ids(db, batch.ids, include_product=include_product,
+                                                  include_customer=include_customer, include_items=include_items)
+    await release_session(db)
+    response_type = schemas.OrderWithCustomer if include_product or include_customer or include_items else schemas.Order
+    return fast_response(schemas.Batch[response_type], {"items": items, "missing": missing})
 
 
 # Асинхронная функция 'read_order' используется для чтения информации о заказе по ID
-@app.get("/orders/{order_id}", response_model=schemas.Order)
-async def read_order(order_id: int, db: AsyncSession = Depends(get_db)):
+@app.get("/orders/{order_id}", response_model=schemas.OrderWithItems)
+async def read_order(order_id: int, db: AsyncSession = Depends(get_read_db)):
     # Получение заказа из базы данных по ID
     db_order = await crud.get_order(db, order_id)
     if db_order is None:
@@ -191,47 +493,67 @@ async def read_order(order_id: int, db: AsyncSession = Depends(get_db)):
 # Асинхронная функция 'update_order' используется для обновления информации о заказе по ID
 @app.put("/orders/{order_id}", response_model=schemas.Order)
 async def update_order(order_id: int, order: schemas.OrderUpdate, db: AsyncSession = Depends(get_db)):
-    # Проверяем по ID, существует ли пользователь
-    db_customer = await crud.get_customer(db, order.customer_id)
-    # Проверяем по ID, существует ли продукт
-    db_product = await crud.get_product(db, order.product_id)
-    if (db_customer is None) or (db_product is None):
-        # Если продукт или пользователь не найден, возвращаем ошибку с кодом 404 (Not Found)
-        error = "Customer not found" if db_customer is None else "Product not found"
-        raise HTTPException(status_code=404, detail=error)
+    # Обновление заказа с помощью crud функций (UPDATE ... FROM products ... RETURNING)
+    try:
+        db_order = await crud.update_order(db, order_id, order)
+    except crud.InsufficientStock:
+        # Если остатка товара не хватает, возвращаем ошибку с кодом 409 (Conflict)
+        raise HTTPException(status_code=409, detail="Insufficient stock")
+    except IntegrityError:
+        # Покупатель или товар удалены параллельно - обрабатываем так же, как их отсутствие
+        db_order = None
 
-    # Получение заказа из базы данных по ID
-    db_order = await crud.get_order(db, order_id)
     if db_order is None:
+        # Заказ не обновлён - выясняем причину (дополнительные запросы только в случае ошибки)
+        db_customer = await crud.get_customer(db, order.customer_id)
+        db_product = await crud.get_product(db, order.product_id)
+        if (db_customer is None) or (db_product is None):
+            # Если продукт или пользователь не найден, возвращаем ошибку с кодом 404 (Not Found)
+            error = "Customer not found" if db_customer is None else "Product not found"
+            raise HTTPException(status_code=404, detail=error)
+
         # Если заказ не найден, вызываем исключение 404 (Not Found)
         raise HTTPException(status_code=404, detail="Order not found")
 
-    # Обновление заказа с помощью crud функций
-    await crud.update_order(db, order_id, order)
     # Возвращаем обновленный заказ
-    return await crud.get_order(db, order_id)
+    return db_order
 
 
 # Асинхронная функция 'delete_order' используется для удаления информации о заказе по ID
 @app.delete("/orders/{order_id}", response_model=schemas.Order)
 async def delete_order(order_id: int, db: AsyncSession = Depends(get_db)):
-    # Получение заказа из базы данных по ID
-    db_order = await crud.get_order(db, order_id)
+    # Удаление заказа c помощью crud функций (DELETE ... RETURNING, сводки продаж обновляются в той же транзакции)
+    db_order = await crud.delete_order(db, order_id)
     if db_order is None:
         # Если заказ не найден, вызываем исключение 404 (Not Found)
         raise HTTPException(status_code=404, detail="Order not found")
 
-    # Удаление заказа c помощью crud функций
-    await crud.delete_order(db, order_id)
     # Возвращаем удаленный заказ
     return db_order
 
 
-# Асинхронная функция 'read_orders' используется для чтения информации о всех заказах в базе данных
-@app.get("/orders/", response_model=list[schemas.Order])
-async def read_orders(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Получение списка заказов из базы данных с применением параметров пагинации
-    return await crud.get_orders(db, skip=skip, limit=limit)
+# Асинхронная функция 'read_orders' используется для чтения информации о всех заказах в базе данных.
+# Фильтры и сортировка выполняются в БД; sort - имя поля, '-' в начале - по убыванию.
+# created_from и created_to (не включительно) ограничивают время создания, и запрос читает только нужные секции
+@app.get("/orders/", response_model=Union[list[schemas.Order], schemas.Page[schemas.Order]])
+async def read_orders(skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                      customer_id: Optional[int] = None, product_id: Optional[int] = None,
+                      total_min: Optional[float] = None, total_max: Optional[float] = None,
+                      created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                      sort: Literal["id", "-id", "total_price", "-total_price"] = "id",
+                      db: AsyncSession = Depends(get_read_db)):
+    filters = dict(sort=sort, customer_id=customer_id, product_id=product_id, total_min=total_min,
+                   total_max=total_max, created_from=created_from, created_to=created_to)
+    if cursor is None:
+        # Получение списка заказов из базы данных с применением параметров пагинации
+        items = await crud.get_orders(db, skip=skip, limit=limit, **filters)
+        await release_session(db)
+        return fast_response(list[schemas.Order], items)
+
+    # Курсорная пагинация: выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_orders(db, limit=limit + 1, after=decode_sort_cursor(cursor, sort), **filters)
+    await release_session(db)
+    return fast_response(schemas.Page[schemas.Order], make_page(items, limit, sort))
 
 
 # --- Обработка маршрутов сущности "customers" ---
@@ -239,19 +561,47 @@ async def read_orders(skip: int = 0, limit: int = 100, db: AsyncSession = Depend
 # Асинхронная функция 'create_customer' используется для создания нового пользователя
 @app.post("/customers/", response_model=schemas.Customer)
 async def create_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
-    # Проверяем, существует ли пользователь с таким же именем
-    db_customer = await crud.get_customer_by_username(db, username=customer.username)
-    if db_customer:
+    # Создаем нового пользователя (INSERT ... ON CONFLICT DO NOTHING)
+    db_customer = await crud.create_customer(db, customer)
+    if db_customer is None:
         # Если пользователь уже существует, возвращаем ошибку с кодом 400 (Bad Request)
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    # Создаем нового пользователя
-    return await crud.create_customer(db, customer)
+    return db_customer
+
+
+# Асинхронная функция 'import_customers' используется для массовой загрузки пользователей из CSV или NDJSON
+# (тело запроса читается потоком и передаётся в БД через COPY)
+@app.post("/customers/import", response_model=schemas.ImportReport)
+async def import_customers(request: Request, db: AsyncSession = Depends(get_db),
+                           import_format: Literal["csv", "ndjson"] = Query("csv", alias="format")):
+    return await import_rows(db, "customers", request.stream(), import_format)
+
+
+# Асинхронная функция 'read_customers_batch' используется для чтения пользователей по списку ID одним запросом
+# к БД: записи возвращаются в порядке запрошенных ID, отсутствующие ID перечисляются в поле missing
+@app.post("/customers/batch", response_model=schemas.Batch[schemas.CustomerWithId])
+async def read_customers_batch(batch: schemas.BatchRequest, db: AsyncSession = Depends(get_read_db)):
+    items, missing = await crud.get_customers_by_ids(db, batch.ids)
+    await release_session(db)
+    return fast_response(schemas.Batch[schemas.CustomerWithId], {"items": items, "missing": missing})
+
+
+# Асинхронная функция 'login_customer' используется для проверки имени и пароля пользователя
+@app.post("/customers/login", response_model=schemas.Customer)
+async def login_customer(credentials: schemas.CustomerLogin, db: AsyncSession = Depends(get_db)):
+    # Проверка пароля выполняется в пуле потоков, устаревший хеш пересчитывается
+    db_customer = await crud.authenticate_customer(db, credentials.username, credentials.password)
+    if db_customer is None:
+        # Если имя или пароль неверны, возвращаем ошибку с кодом 401 (Unauthorized)
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+
+    return db_customer
 
 
 # Асинхронная функция 'read_customer' используется для чтения информации о пользователе по ID
 @app.get("/customers/{customer_id}", response_model=schemas.Customer)
-async def read_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
+async def read_customer(customer_id: int, db: AsyncSession = Depends(get_read_db)):
     # Получение пользователя из базы данных по ID
     db_customer = await crud.get_customer(db, customer_id)
     if db_customer is None:
@@ -262,48 +612,130 @@ async def read_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
     return db_customer
 
 
+# Асинхронная функция 'read_customer_orders' используется для чтения заказов пользователя с курсорной пагинацией
+@app.get("/customers/{customer_id}/orders", response_model=schemas.Page[schemas.OrderWithProduct])
+async def read_customer_orders(customer_id: int, limit: int = 100, cursor: Optional[str] = None,
+                               include_product: bool = False, include_items: bool = False,
+                               created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                               db: AsyncSession = Depends(get_read_db)):
+    # Выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_customer_orders(db, customer_id, limit=limit + 1, after_id=decode_cursor(cursor or ""),
+                                           include_product=include_product, include_items=include_items,
+                                           created_from=created_from, created_to=created_to)
+    if not items and await crud.get_customer(db, customer_id) is None:
+        # Если пользователь не найден, вызываем исключение 404 (Not Found)
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    await release_session(db)
+    return fast_response(schemas.Page[schemas.OrderWithProduct], make_page(items, limit))
+
+
 # Асинхронная функция 'update_customer' используется для обновления информации о пользователе по ID
 @app.put("/customers/{customer_id}", response_model=schemas.Customer)
 async def update_customer(customer_id: int, customer: schemas.CustomerUpdate, db: AsyncSession = Depends(get_db)):
-    # Проверяем, существует ли пользователь с таким же именем
-    db_customer = await crud.get_customer_by_username(db, username=customer.username)
-    if db_customer and db_customer.id != customer_id:
-        # Если пользователь уже существует, возвращаем ошибку с кодом 400 (Bad Request)
+    # Обновление пользователя с помощью crud функции (UPDATE ... RETURNING)
+    try:
+        db_customer = await crud.update_customer(db, customer_id, customer)
+    except IntegrityError:
+        # Если пользователь с таким именем уже существует, возвращаем ошибку с кодом 400 (Bad Request)
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    # Получение пользователя из базы данных по ID
-    db_customer = await crud.get_customer(db, customer_id=customer_id)
     if db_customer is None:
         # Если пользователь не найден, вызываем исключение 404 (Not Found)
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    # Обновление пользователя с помощью crud функции
-    await crud.update_customer(db, customer_id, customer)
     # Возвращаем данные пользователя
-    return await crud.get_customer(db, customer_id)
+    return db_customer
 
 
 # Асинхронная функция 'delete_customer' используется для удаления пользователя по ID
 @app.delete("/customers/{customer_id}", response_model=schemas.Customer)
 async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
-    # Получение пользователя из базы данных по ID
-    db_customer = await crud.get_customer(db, customer_id)
+    # Удаление пользователя одним запросом (DELETE ... RETURNING)
+    db_customer = await crud.delete_customer(db, customer_id)
     if db_customer is None:
         # Если пользователь не найден, вызываем исключение 404 (Not Found)
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    # Удаление пользователя с помощью crud функции
-    await crud.delete_customer(db, customer_id)
     # Возвращаем данные удалённого пользователя
     return db_customer
 
 
 # Асинхронная функция 'read_customers' используется для чтения списка пользователей
-@app.get("/customers/", response_model=list[schemas.Customer])
-async def read_customers(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Получение списка пользователей из базы данных
-    return await crud.get_customers(db, skip=skip, limit=limit)
+@app.get("/customers/", response_model=Union[list[schemas.Customer], schemas.Page[schemas.Customer]])
+async def read_customers(skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                         db: AsyncSession = Depends(get_read_db)):
+    if cursor is None:
+        # Получение списка пользователей из базы данных
+        items = await crud.get_customers(db, skip=skip, limit=limit)
+        await release_session(db)
+        return fast_response(list[schemas.Customer], items)
+
+    # Курсорная пагинация: выбираем на одну запись больше, чтобы понять, есть ли следующая страница
+    items = await crud.get_customers(db, limit=limit + 1, after_id=decode_cursor(cursor))
+    await release_session(db)
+    return fast_response(schemas.Page[schemas.Customer], make_page(items, limit))
+
+
+
+# --- Обработка маршрутов аналитики продаж ---
+
+# Асинхронная функция 'read_product_sales' возвращает топ товаров по выручке, количеству единиц или числу заказов
+@app.get("/analytics/products", response_model=list[schemas.SalesSummary])
+async def read_product_sales(limit: int = Query(10, ge=1, le=1000),
+                             order_by: Literal["revenue", "units", "orders_count"] = "revenue",
+                             db: AsyncSession = Depends(get_read_db)):
+    # Читаем готовую сводку, без сканирования таблицы заказов
+    summaries = await crud.get_product_sales(db, limit=limit, order_by=order_by)
+    await release_session(db)
+    return fast_response(list[schemas.SalesSummary], summaries)
+
+
+# Асинхронная функция 'read_category_sales' возвращает топ категорий по продажам
+@app.get("/analytics/categories", response_model=list[schemas.SalesSummary])
+async def read_category_sales(limit: int = Query(10, ge=1, le=1000),
+                              order_by: Literal["revenue", "units", "orders_count"] = "revenue",
+                              db: AsyncSession = Depends(get_read_db)):
+    summaries = await crud.get_category_sales(db, limit=limit, order_by=order_by)
+    await release_session(db)
+    return fast_response(list[schemas.SalesSummary], summaries)
+
+
+# Асинхронная функция 'read_customer_sales' возвращает топ покупателей по продажам
+@app.get("/analytics/customers", response_model=list[schemas.SalesSummary])
+async def read_customer_sales(limit: int = Query(10, ge=1, le=1000),
+                              order_by: Literal["revenue", "units", "orders_count"] = "revenue",
+                              db: AsyncSession = Depends(get_read_db)):
+    summaries = await crud.get_customer_sales(db, limit=limit, order_by=order_by)
+    await release_session(db)
+    return fast_response(list[schemas.SalesSummary], summaries)
+
+
+# --- Служебные маршруты ---
+
+# Асинхронная функция 'read_cache_stats' возвращает счётчики попаданий и промахов кэша каталога
+@app.get("/internal/cache")
+async def read_cache_stats():
+    return crud.catalog_cache.stats()
+
+
+# Асинхронная функция 'read_pool_stats' возвращает состояние пула соединений: занятые соединения, overflow и ожидания,
+# а также итог прогрева при запуске
+@app.get("/internal/pool")
+async def read_pool_stats():
+    return dict(pool_stats(), warmup=warmup_stats)
+
+
+# Асинхронная функция 'read_ingest_stats' возвращает состояние очереди приёма заказов
+@app.get("/internal/ingest")
+async def read_ingest_stats():
+    return order_queue.stats()
+
 
+# Асинхронная функция 'read_metrics' отдаёт метрики в текстовом формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     import uvicorn
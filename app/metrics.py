@@ -0,0 +1,153 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 20, 50)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Бакеты в формате Prometheus накопительные: le="0.1" включает все наблюдения <= 0.1
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield bound, total
+
+
+# Счётчики одного запроса: число SQL-запросов, суммарное время их выполнения и время, в течение которого
+# запрос держал соединения пула (от выдачи соединения до возврата в пул)
+class RequestMetrics:
+    __slots__ = ("queries", "sql_time", "connection_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.connection_time = 0.0
+
+
+current_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request_metrics", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.db_queries = {}
+        self.db_time = {}
+        self.db_connection_time = {}
+        self.queries_total = 0
+        self.sql_time_total = 0.0
+        self.connection_hold = Histogram(LATENCY_BUCKETS)
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float, request: RequestMetrics):
+        key = (method, route)
+        self.requests[key + (str(status),)] = self.requests.get(key + (str(status),), 0) + 1
+        self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+        self.db_queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(request.queries)
+        self.db_time[key] = self.db_time.get(key, 0.0) + request.sql_time
+        self.db_connection_time.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(request.connection_time)
+
+    def observe_query(self, elapsed: float):
+        self.queries_total += 1
+        self.sql_time_total += elapsed
+        request = current_request_metrics.get()
+        if request is not None:
+            request.queries += 1
+            request.sql_time += elapsed
+
+    # Соединение возвращено в пул; request - счётчики HTTP-запроса, который его получил (None - фоновая задача)
+    def observe_connection_hold(self, elapsed: float, request: Optional[RequestMetrics] = None):
+        self.connection_hold.observe(elapsed)
+        if request is not None:
+            request.connection_time += elapsed
+
+    # Текстовый формат экспозиции Prometheus (version 0.0.4)
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Total HTTP requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        lines += _render_histograms("http_request_duration_seconds", "HTTP request latency by route.", self.latency)
+        lines += _render_histograms("http_request_db_queries", "SQL queries per HTTP request by route.",
+                                    self.db_queries)
+        lines += _render_histograms("http_request_db_connection_seconds",
+                                    "Time an HTTP request held pooled connections by route.", self.db_connection_time)
+
+        lines += [
+            "# HELP http_request_db_seconds_total Time spent in SQL queries by route.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        for (method, route), seconds in sorted(self.db_time.items()):
+            lines.append(f'http_request_db_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+
+        lines += [
+            "# HELP db_queries_total Total SQL queries executed.",
+            "# TYPE db_queries_total counter",
+            f"db_queries_total {self.queries_total}",
+            "# HELP db_query_seconds_total Total time spent in SQL queries.",
+            "# TYPE db_query_seconds_total counter",
+            f"db_query_seconds_total {self.sql_time_total}",
+            "# HELP db_connection_hold_seconds Time a connection was checked out of the pool.",
+            "# TYPE db_connection_hold_seconds histogram",
+        ]
+        for bound, count in self.connection_hold.cumulative():
+            lines.append(f'db_connection_hold_seconds_bucket{{le="{bound}"}} {count}')
+        lines.append(f"db_connection_hold_seconds_sum {self.connection_hold.sum}")
+        lines.append(f"db_connection_hold_seconds_count {self.connection_hold.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_histograms(name: str, help_text: str, histograms: dict):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = f'method="{method}",route="{route}"'
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+# Подсчёт SQL-запросов и времени удержания соединений через события движка и пула; время относится к текущему
+# HTTP-запросу через contextvar (для соединения - к запросу, который его получил)
+def instrument_engine(async_engine):
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        registry.observe_query(time.perf_counter() - context._query_start)
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checkout"] = (time.perf_counter(), current_request_metrics.get())
+
+    @event.listens_for(sync_engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        checkout_at, request = connection_record.info.pop("checkout", (None, None))
+        if checkout_at is not None:
+            registry.observe_connection_hold(time.perf_counter() - checkout_at, request)
@@ -1,7 +1,19 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import (CheckConstraint, Column, Integer, String, ForeignKey, ForeignKeyConstraint, Float, DateTime,
+                        Index, JSON, DDL, PrimaryKeyConstraint, event, func, literal_column)
 from sqlalchemy.orm import relationship
 from app.database import Base
 
+# Расширение pg_trgm нужно для индекса нечёткого поиска товаров по имени
+event.listen(Base.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
+# Документ товара для полнотекстового поиска. Выражение используется и в индексе, и в запросах,
+# поэтому все константы выводятся литералами (иначе планировщик не сопоставит запрос с индексом)
+def product_search_document(name, description):
+    return func.to_tsvector(literal_column("'simple'"), func.coalesce(name, literal_column("''")) +
+                            literal_column("' '") + func.coalesce(description, literal_column("''")))
+
 
 # Модель клиент
 class Customer(Base):
@@ -20,6 +32,9 @@ class Category(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
+    # Версия строки и время изменения (для ETag и Last-Modified), обновляются функциями crud при изменении
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
     products = relationship('Product', back_populates='category')
 
@@ -33,20 +48,149 @@ class Product(Base):
     description = Column(String, nullable=True)
     price = Column(Float, nullable=False)
     category_id = Column(Integer, ForeignKey('categories.id'))
+    # Версия строки и время изменения (для ETag и Last-Modified), обновляются функциями crud при изменении
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Остаток на складе: пустой - остаток не учитывается. При stock_shards > 0 остаток разбит на части
+    # в product_stock_shards (для товаров, которые покупают одновременно многие покупатели), а stock пустой
+    stock = Column(Integer, nullable=True)
+    stock_shards = Column(Integer, nullable=False, default=0, server_default='0')
 
     category = relationship('Category', back_populates='products')
     orders = relationship('Order', back_populates='product')
 
-
-# Модель заказа
+    # Составные индексы для выборки товаров категории и сортировки по цене и имени с курсорной пагинацией,
+    # индекс text_pattern_ops для фильтра по префиксу имени (LIKE 'abc%' при любой локали БД),
+    # GIN-индексы для полнотекстового поиска и поиска по триграммам (только PostgreSQL)
+    __table_args__ = (
+        CheckConstraint('stock >= 0', name='ck_products_stock'),
+        Index('ix_products_category_id_id', 'category_id', 'id'),
+        Index('ix_products_price_id', 'price', 'id'),
+        Index('ix_products_name_id', 'name', 'id'),
+        Index('ix_products_name_pattern', name, postgresql_ops={'name': 'text_pattern_ops'}).ddl_if(
+            dialect='postgresql'),
+        Index('ix_products_search', product_search_document(name, description),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+        Index('ix_products_name_trgm', name, postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+
+# Часть остатка товара. Покупка списывает количество с одной случайной части, поэтому параллельные покупки
+# одного товара блокируют разные строки, а не одну строку товара
+class ProductStockShard(Base):
+    __tablename__ = 'product_stock_shards'
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        CheckConstraint('stock >= 0', name='ck_product_stock_shards_stock'),
+    )
+
+
+# Модель заказа. В PostgreSQL таблица секционирована по месяцам created_at (секции orders_yГГГГmММ создаёт
+# фоновая задача app.partitions, строки вне созданных секций попадают в orders_default), поэтому первичный ключ
+# таблицы в PostgreSQL - (id, created_at), а фильтр по времени создания позволяет планировщику исключить лишние
+# секции. В других СУБД (SQLite для тестов и замеров) таблица обычная с ключом id; ORM в обоих случаях
+# идентифицирует заказ по id (значения id уникальны благодаря последовательности)
 class Order(Base):
     __tablename__ = 'orders'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     customer_id = Column(Integer, ForeignKey('customers.id'))
     product_id = Column(Integer, ForeignKey('products.id'))
     quantity = Column(Integer, nullable=False)
     total_price = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
     customer = relationship('Customer', back_populates='orders')
     product = relationship('Product', back_populates='orders')
+    items = relationship('OrderItem', back_populates='order', order_by='OrderItem.id', passive_deletes=True)
+
+    # Составные индексы для выборки заказов покупателя или товара и сортировки по сумме с курсорной пагинацией
+    __table_args__ = (
+        PrimaryKeyConstraint('id', name='orders_pkey').ddl_if(
+            callable_=lambda ddl, target, bind, dialect=None, **kw: dialect.name != 'postgresql'),
+        Index('ix_orders_customer_id_id', 'customer_id', 'id'),
+        Index('ix_orders_product_id_id', 'product_id', 'id'),
+        Index('ix_orders_total_price_id', 'total_price', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+event.listen(Order.__table__, 'after_create',
+             DDL('ALTER TABLE orders ADD CONSTRAINT orders_pkey PRIMARY KEY (id, created_at)').execute_if(
+                 dialect='postgresql'))
+event.listen(Order.__table__, 'after_create',
+             DDL('CREATE TABLE orders_default PARTITION OF orders DEFAULT').execute_if(dialect='postgresql'))
+
+
+# Модель позиции заказа. Заказ из корзины (несколько позиций) хранит в orders общее количество и сумму,
+# product_id у такого заказа пустой
+class OrderItem(Base):
+    __tablename__ = 'order_items'
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, nullable=False)
+    # Время создания заказа: часть ключа заказа, на который ссылается позиция
+    order_created_at = Column(DateTime(timezone=True), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    price = Column(Float, nullable=False)
+    total_price = Column(Float, nullable=False)
+
+    order = relationship('Order', back_populates='items')
+    product = relationship('Product')
+
+    # Позиции заказа выбираются по (order_id, id), индекс по product_id нужен для проверки внешнего ключа
+    __table_args__ = (
+        ForeignKeyConstraint(['order_id', 'order_created_at'], ['orders.id', 'orders.created_at'],
+                             name='order_items_order_id_fkey', ondelete='CASCADE'),
+        Index('ix_order_items_order_id_id', 'order_id', 'id'),
+        Index('ix_order_items_product_id', 'product_id'),
+    )
+
+
+# Сводка продаж по товару, поддерживается функциями crud при изменении заказов
+class ProductSales(Base):
+    __tablename__ = 'product_sales'
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+# Сводка продаж по категории, поддерживается функциями crud при изменении заказов: заказ учитывается в категории
+# товара на момент изменения заказа, заказ из корзины с несколькими товарами одной категории - один раз
+class CategorySales(Base):
+    __tablename__ = 'category_sales'
+
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+# Сводка продаж по клиенту, поддерживается функциями crud при изменении заказов
+class CustomerSales(Base):
+    __tablename__ = 'customer_sales'
+
+    customer_id = Column(Integer, ForeignKey('customers.id', ondelete='CASCADE'), primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+# Ключ идемпотентности (заголовок Idempotency-Key) создания заказа. Строка вставляется в транзакции создания заказа
+# и фиксируется вместе с ним, поэтому зафиксированный ключ всегда содержит ответ. fingerprint - хеш маршрута
+# и тела запроса: повтор ключа с другим запросом отклоняется
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    response = Column(JSON, nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,53 @@
+import base64
+import json
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+
+# Курсор - это непрозрачная для клиента строка (base64 от JSON с id последней записи страницы).
+# Для сортировки не по id в курсор добавляются сортировка (s) и значение поля (v) последней записи
+def encode_cursor(last_id: int, sort: str = "id", value: Any = None) -> str:
+    data = {"id": last_id}
+    if sort != "id":
+        data.update(s=sort, v=value)
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        data["id"] = int(data["id"])
+        return data
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Пустой курсор означает первую страницу, некорректный - ошибку 400 (Bad Request)
+def decode_cursor(cursor: str) -> Optional[int]:
+    if not cursor:
+        return None
+    return _decode(cursor)["id"]
+
+
+# Курсор списка с сортировкой: пара (значение поля сортировки, id) последней записи.
+# Курсор, выданный для другой сортировки, считается некорректным
+def decode_sort_cursor(cursor: str, sort: str) -> Optional[Tuple[Any, int]]:
+    if not cursor:
+        return None
+    data = _decode(cursor)
+    if data.get("s", "id") != sort or (sort.lstrip("-") != "id" and "v" not in data):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data.get("v", data["id"]), data["id"]
+
+
+# Из limit + 1 выбранных записей формируем страницу и курсор на следующую
+def make_page(items: Sequence, limit: int, sort: str = "id") -> dict:
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.id, sort, getattr(last, sort.lstrip("-")))
+    return {"items": items, "next_cursor": next_cursor}
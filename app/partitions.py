@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_order_partition_check_interval, get_order_partition_months_ahead
+from app.database import SessionLocal
+from app.export import json_default
+
+logger = logging.getLogger(__name__)
+
+ORDER_PARTITION_MONTHS_AHEAD = get_order_partition_months_ahead()
+ORDER_PARTITION_CHECK_INTERVAL = get_order_partition_check_interval()
+PARTITION_NAME = re.compile(r"^orders_y(\d{4})m(\d{2})$")
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# Секция заказов за месяц: orders_yГГГГmММ, границы - начало месяца и начало следующего по UTC
+def partition_name(month: date) -> str:
+    return f"orders_y{month.year:04d}m{month.month:02d}"
+
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+# Создание секции месяца. Запись в заказы блокируется до конца транзакции: если строки месяца уже попали в секцию
+# по умолчанию (секцию не создали заранее), PostgreSQL не создаст секцию, пока они там, поэтому такие заказы
+# вместе с позициями переносятся через временные таблицы в созданную секцию
+async def _create_order_partition(db: AsyncSession, month: date):
+    window = f"created_at >= '{_bound(month)}' AND created_at < '{_bound(add_months(month, 1))}'"
+    await db.execute(text("LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE"))
+    move = await db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM orders_default WHERE {window})"))
+    if move:
+        await db.execute(text(f"CREATE TEMP TABLE moved_orders ON COMMIT DROP AS "
+                              f"SELECT * FROM orders_default WHERE {window}"))
+        await db.execute(text("CREATE TEMP TABLE moved_order_items ON COMMIT DROP AS SELECT i.* FROM order_items i "
+                              "JOIN moved_orders o ON i.order_id = o.id AND i.order_created_at = o.created_at"))
+        # Позиции удаляются каскадно и возвращаются после переноса заказов
+        await db.execute(text(f"DELETE FROM orders_default WHERE {window}"))
+    await db.execute(text(f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF orders "
+                          f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(add_months(month, 1))}')"))
+    if move:
+        await db.execute(text("INSERT INTO orders SELECT * FROM moved_orders"))
+        await db.execute(text("INSERT INTO order_items SELECT * FROM moved_order_items"))
+
+
+# Секции текущего месяца и months_ahead следующих, каждая в отдельной транзакции: ошибка одного месяца
+# записывается в лог и не мешает создать остальные. Возвращает имена созданных секций
+async def create_order_partitions(db: AsyncSession, months_ahead: int = ORDER_PARTITION_MONTHS_AHEAD,
+                                  today: Optional[date] = None) -> List[str]:
+    current = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    created = []
+    for month in (add_months(current, offset) for offset in range(months_ahead + 1)):
+        name = partition_name(month)
+        if await db.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None:
+            continue
+        try:
+            await _create_order_partition(db, month)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("Order partition %s was not created", name)
+            continue
+        created.append(name)
+    return created
+
+
+# Месячные секции заказов (секция по умолчанию не входит) в порядке месяцев: [(месяц, имя)]
+async def list_order_partitions(db: AsyncSession) -> List[tuple]:
+    result = await db.execute(text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                                   "WHERE i.inhparent = 'orders'::regclass"))
+    partitions = []
+    for name in result.scalars().all():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+# Выгрузка секции в NDJSON: заказы по id, позиции заказов из корзины - в поле items. Заказы выбираются пачками
+# по первичному ключу (id > последнего выгруженного), а не серверным курсором: открытый курсор до конца
+# транзакции не дал бы отсоединить и удалить секцию
+async def _export_partition(db: AsyncSession, name: str, path: str, batch_size: int = 1000) -> int:
+    items_table = models.OrderItem.__table__
+    exported = 0
+    last_id = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while True:
+            result = await db.execute(text(f"SELECT * FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                                      {"last_id": last_id, "limit": batch_size})
+            orders = result.mappings().all()
+            if not orders:
+                return exported
+            items = {}
+            rows = await db.execute(select(items_table).where(
+                items_table.c.order_id.in_([order["id"] for order in orders])).order_by(items_table.c.id))
+            for item in rows.mappings():
+                items.setdefault(item["order_id"], []).append(dict(item))
+            for order in orders:
+                row = dict(order, items=items[order["id"]]) if order["id"] in items else dict(order)
+                f.write(json.dumps(row, default=json_default) + "\n")
+            exported += len(orders)
+            last_id = orders[-1]["id"]
+
+
+# Архивирование месячных секций, которые целиком старше месяца before: каждая секция выгружается в файл
+# <directory>/<секция>.ndjson, её позиции удаляются, секция отсоединяется от orders и удаляется (keep - оставить
+# отсоединённую таблицу), всё в отдельной транзакции на секцию. Сводки продаж не меняются: архивные заказы
+# в них остаются учтены
+async def archive_order_partitions(db: AsyncSession, before: date, directory: str, keep: bool = False) -> List[dict]:
+    cutoff = before.replace(day=1)
+    archived = []
+    for month, name in await list_order_partitions(db):
+        if month >= cutoff:
+            continue
+        path = os.path.join(directory, f"{name}.ndjson")
+        try:
+            orders = await _export_partition(db, name, path + ".tmp")
+            await db.execute(text(f"DELETE FROM order_items i USING {name} o "
+                                  f"WHERE i.order_id = o.id AND i.order_created_at = o.created_at"))
+            await db.execute(text(f"ALTER TABLE orders DETACH PARTITION {name}"))
+            if not keep:
+                await db.execute(text(f"DROP TABLE {name}"))
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            raise
+        os.replace(path + ".tmp", path)
+        archived.append({"partition": name, "orders": orders, "path": path})
+    return archived
+
+
+# Проверка секций заказов: создаёт недостающие секции, ошибки записываются в лог
+async def check_order_partitions(sessionmaker=SessionLocal):
+    try:
+        async with sessionmaker() as db:
+            created = await create_order_partitions(db)
+        if created:
+            logger.info("Order partitions created: %s", ", ".join(created))
+    except Exception:
+        logger.exception("Order partition job failed")
+
+
+# Фоновая задача приложения: каждые interval секунд создаёт недостающие секции заказов (при запуске секции
+# создаются до приёма запросов, см. lifespan в app.main)
+async def run_partition_job(interval: float = ORDER_PARTITION_CHECK_INTERVAL, sessionmaker=SessionLocal):
+    while True:
+        await asyncio.sleep(interval)
+        await check_order_partitions(sessionmaker)
@@ -1,7 +1,8 @@
 # schemas.py
 
-from typing import List, Optional
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Annotated, Generic, List, Literal, Optional, TypeVar
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # === Schemas for Categories ===
@@ -20,9 +21,18 @@ class CategoryUpdate(CategoryBase):
 
 class Category(CategoryBase):
     id: int
+    version: int
+    updated_at: datetime
 
-    class Config:
-        orm_mode: True
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Версия записи каталога для условных запросов (ETag)
+class CatalogVersion(BaseModel):
+    version: int
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 # === Schemas for Products ===
@@ -44,9 +54,25 @@ class ProductUpdate(ProductBase):
 
 class Product(ProductBase):
     id: int
+    version: int
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductWithCategory(Product):
+    category: Optional[Category] = None
+
+
+# Остаток товара на складе (не входит в схему товара, чтобы списание не сбрасывало кэш и ETag каталога).
+# stock пустой - остаток не учитывается; shards > 0 - остаток разбит на части для одновременных покупок
+class ProductStockUpdate(BaseModel):
+    stock: Optional[int] = Field(default=None, ge=0)
+    shards: int = Field(default=0, ge=0, le=64)
+
 
-    class Config:
-        orm_mode: True
+class ProductStock(ProductStockUpdate):
+    product_id: int
 
 
 # === Schemas for Orders ===
@@ -58,38 +84,152 @@ class OrderBase(BaseModel):
 
 
 class OrderCreate(OrderBase):
-    pass
+    quantity: int = Field(gt=0)
 
 
 class OrderUpdate(OrderBase):
-    pass
+    quantity: int = Field(gt=0)
+
+
+# Позиция заказа из корзины
+class OrderItemBase(BaseModel):
+    product_id: int
+    quantity: int
+
+
+class OrderItemCreate(OrderItemBase):
+    quantity: int = Field(gt=0)
 
 
+class OrderItem(OrderItemBase):
+    id: int
+    price: float
+    total_price: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Заказ из корзины: несколько позиций создаются одним запросом
+class OrderCartCreate(BaseModel):
+    customer_id: int
+    items: List[OrderItemCreate] = Field(min_length=1, max_length=100)
+
+
+# У заказа из корзины product_id пустой, а quantity и total_price - итоги по позициям.
+# created_at может отсутствовать в ответах, сохранённых для ключей идемпотентности до его появления
 class Order(OrderBase):
     id: int
+    product_id: Optional[int] = None
     total_price: float
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderWithProduct(Order):
+    product: Optional[Product] = None
+    items: List[OrderItem] = []
+
+
+class OrderWithItems(Order):
+    items: List[OrderItem] = []
+
+
+# Статус заказа, принятого в очередь: queued - ожидает записи, created - создан, failed - не создан (detail)
+class OrderIngestStatus(BaseModel):
+    tracking_id: str
+    status: Literal["queued", "created", "failed"]
+    order: Optional[Order] = None
+    detail: Optional[str] = None
+
 
-    class Config:
-        orm_mode: True
+# Тело массового создания заказов: список не длиннее 1000 заказов, чтобы один запрос не держал транзакцию
+# и соединение неограниченно долго
+OrderBulkCreate = Annotated[List[OrderCreate], Field(max_length=1000)]
+
+
+class OrderBulkItem(BaseModel):
+    index: int
+    order: Optional[Order] = None
+    detail: Optional[str] = None
 
 
 # === Schemas for Customers ===
 
 class CustomerBase(BaseModel):
     username: str
-    password: str
 
 
 class CustomerCreate(CustomerBase):
-    pass
+    password: str
 
 
 class CustomerUpdate(CustomerBase):
-    pass
+    password: str
+
+
+class CustomerLogin(CustomerBase):
+    password: str
 
 
 class Customer(CustomerBase):
-    pass
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CustomerWithId(Customer):
+    id: int
+
+
+# Заказ с товаром и покупателем (выборка заказов по списку id)
+class OrderWithCustomer(OrderWithProduct):
+    customer: Optional[CustomerWithId] = None
+
+
+# === Schemas for Analytics ===
+
+class SalesSummary(BaseModel):
+    id: int
+    name: str
+    orders_count: int
+    units: int
+    revenue: float
+
+
+# === Schemas for bulk import ===
+
+class ImportRejectedRow(BaseModel):
+    line: int
+    detail: str
+
+
+# Итог массовой загрузки: unchanged - строки, совпавшие с уже сохранёнными записями; errors - первые отклонённые строки
+class ImportReport(BaseModel):
+    entity: str
+    received: int
+    inserted: int
+    updated: int
+    unchanged: int
+    rejected: int
+    errors: List[ImportRejectedRow]
+
+
+# === Schemas for pagination ===
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+# === Schemas for batch lookups ===
+
+class BatchRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
+
 
-    class Config:
-        orm_mode: True
+# Записи в порядке запрошенных id (повторы - один раз); missing - id, для которых записей нет
+class Batch(BaseModel, Generic[T]):
+    items: List[T]
+    missing: List[int]
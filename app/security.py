@@ -0,0 +1,66 @@
+import asyncio
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+
+# Хеширование паролей Argon2 в отдельном пуле потоков: вычисление хеша занимает десятки миллисекунд
+# и, выполненное в цикле событий, остановило бы обработку всех остальных запросов процесса.
+# argon2-cffi освобождает GIL на время вычисления, поэтому потоки работают параллельно.
+# Число одновременных вычислений ограничено семафором (каждое занимает memory_cost КиБ памяти),
+# остальные запросы ждут своей очереди в цикле событий. max_workers=0 - вычисление прямо в цикле событий
+class PasswordHasherPool:
+    def __init__(self, hasher: PasswordHasher, max_workers: int = 4):
+        self.hasher = hasher
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="password-hash") if max_workers else None
+        self._semaphore = asyncio.Semaphore(max_workers or 1)
+        # Хеш для проверки пароля несуществующего пользователя: время ответа не должно выдавать, есть ли логин
+        self._dummy_hash: Optional[str] = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hasher.hash, password)
+
+    async def verify(self, password_hash: Optional[str], password: str) -> bool:
+        if password_hash is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = await self.hash("dummy password")
+            password_hash = self._dummy_hash
+        elif not is_password_hash(password_hash):
+            # Пароли, сохранённые до введения хеширования, сравниваются как есть и заменяются хешем при входе
+            return hmac.compare_digest(password_hash.encode(), password.encode())
+        try:
+            return await self._run(self.hasher.verify, password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    # Хеш нужно пересчитать, если он получен с другими параметрами Argon2 или пароль ещё не хеширован
+    def needs_rehash(self, password_hash: str) -> bool:
+        return not is_password_hash(password_hash) or self.hasher.check_needs_rehash(password_hash)
+
+
+def is_password_hash(value: str) -> bool:
+    return value.startswith("$argon2")
+
+
+# Параметры задаются переменными окружения: PASSWORD_HASH_WORKERS - размер пула,
+# PASSWORD_HASH_TIME_COST, PASSWORD_HASH_MEMORY_COST (КиБ), PASSWORD_HASH_PARALLELISM - параметры Argon2.
+# При изменении параметров старые хеши пересчитываются при следующем входе пользователя
+def create_password_hasher() -> PasswordHasherPool:
+    defaults = PasswordHasher()
+    hasher = PasswordHasher(
+        time_cost=int(os.getenv("PASSWORD_HASH_TIME_COST", defaults.time_cost)),
+        memory_cost=int(os.getenv("PASSWORD_HASH_MEMORY_COST", defaults.memory_cost)),
+        parallelism=int(os.getenv("PASSWORD_HASH_PARALLELISM", defaults.parallelism)),
+    )
+    return PasswordHasherPool(hasher, max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "4")))
@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+
+# TypeAdapter строит валидатор и сериализатор схемы один раз на тип ответа
+@lru_cache(maxsize=None)
+def get_adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+# Ответ с уже сериализованным JSON (bytes). FastAPI не обрабатывает возвращённый Response повторно,
+# поэтому response_model в декораторе маршрута остаётся только для документации OpenAPI
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+
+# Быстрый путь для списков: строки БД (или ORM-объекты) проверяются по схеме через атрибуты
+# и сериализуются в JSON средствами pydantic-core, без промежуточных dict и jsonable_encoder
+def fast_response(response_type, content) -> FastJSONResponse:
+    adapter = get_adapter(response_type)
+    return FastJSONResponse(adapter.dump_json(adapter.validate_python(content, from_attributes=True)))
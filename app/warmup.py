@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import TimedQueuePool, engine, engine_settings, replicas
+
+logger = logging.getLogger(__name__)
+
+# Итог последнего прогрева (для /internal/pool)
+warmup_stats = {}
+
+
+async def _warm_connection(connection) -> int:
+    async with AsyncSession(bind=connection) as db:
+        return await crud.warm_up_queries(db)
+
+
+# Прогрев пула одного движка: сначала открываются все connections соединений (удерживаются одновременно, поэтому
+# это разные соединения пула), затем на каждом выполняются частые запросы, и соединения возвращаются в пул открытыми
+async def _warm_up_engine(target, connections: int) -> int:
+    if not isinstance(target.pool, TimedQueuePool):
+        connections = 1
+    opened = await asyncio.gather(*(target.connect() for _ in range(connections)), return_exceptions=True)
+    connected = [connection for connection in opened if not isinstance(connection, BaseException)]
+    try:
+        errors = [connection for connection in opened if isinstance(connection, BaseException)]
+        if errors:
+            raise errors[0]
+        return sum(await asyncio.gather(*(_warm_connection(connection) for connection in connected)))
+    finally:
+        await asyncio.gather(*(connection.close() for connection in connected))
+
+
+# Прогрев при запуске приложения: открывает connections соединений пула основной БД и каждой реплики
+# (не больше размера пула) и готовит на них частые запросы, чтобы первые запросы клиентов не ждали установки
+# соединения и подготовки выражений. Ошибка прогрева не останавливает запуск
+async def warm_up(connections: int = engine_settings.warmup_connections) -> dict:
+    if connections <= 0:
+        return warmup_stats
+    connections = min(connections, engine_settings.pool_size)
+    engines = [engine, *(replicas.engines if replicas is not None else [])]
+    start = time.perf_counter()
+    try:
+        statements = sum(await asyncio.gather(*(_warm_up_engine(target, connections) for target in engines)))
+    except Exception:
+        logger.exception("Database warm-up failed")
+        return warmup_stats
+    warmup_stats.update(connections=connections, engines=len(engines), statements=statements,
+                        seconds=round(time.perf_counter() - start, 3))
+    logger.info("Database warm-up: %d connections, %d statements in %.3f s", connections * len(engines),
+                statements, warmup_stats["seconds"])
+    return warmup_stats
@@ -0,0 +1,131 @@
+# bench_passwords.py
+#
+# Отзывчивость цикла событий при всплеске регистраций: параллельно с POST /customers/ (хеширование Argon2)
+# измеряются задержка цикла событий (насколько позже срабатывает asyncio.sleep) и время ответа лёгкого запроса.
+# PASSWORD_HASH_WORKERS=0 (--workers 0) хеширует прямо в цикле событий - для сравнения с пулом потоков.
+#
+#   python -m benchmarks.bench_passwords --signups 200 --concurrency 32 --workers 4
+#   python -m benchmarks.bench_passwords --signups 200 --concurrency 32 --workers 0
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.bench_api import DEFAULT_DATABASE_URL, git_revision, percentile
+
+PROBE_INTERVAL = 0.005
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Event loop responsiveness during a signup burst")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL))
+    parser.add_argument("--signups", type=int, default=200, help="number of customers to register")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of concurrent signup clients")
+    parser.add_argument("--workers", type=int, default=4, help="password hashing threads (0 - hash on the event loop)")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def _stats(values) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+async def run_burst(app, args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    prefix = uuid.uuid4().hex[:8]
+    pending = iter(range(args.signups))
+    signup_latencies = []
+    probe_latencies = []
+    loop_lags = []
+    done = asyncio.Event()
+
+    async def signup_client(client):
+        for i in pending:
+            start = time.perf_counter()
+            response = await client.post("/customers/", json={"username": f"bench-{prefix}-{i}", "password": "secret"})
+            signup_latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    # Задержка цикла событий: насколько позже запланированного просыпается корутина
+    async def lag_probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            loop_lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+    # Лёгкий запрос без обращения к БД, который не должен ждать хеширования чужих паролей
+    async def request_probe(client):
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/internal/cache")
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        probes = [asyncio.create_task(lag_probe()), asyncio.create_task(request_probe(client))]
+        started = time.perf_counter()
+        await asyncio.gather(*(signup_client(client) for _ in range(args.concurrency)))
+        duration = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*probes)
+
+    return {
+        "signups": dict(_stats(signup_latencies), throughput_rps=len(signup_latencies) / duration),
+        "loop_lag": _stats(loop_lags),
+        "probe_request": _stats(probe_latencies),
+        "duration": duration,
+    }
+
+
+def print_report(results: dict):
+    header = f"{'metric':16} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name in ("signups", "loop_lag", "probe_request"):
+        row = results[name]
+        print(f"{name:16} {row['count']:>7} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+    print(f"signup throughput: {results['signups']['throughput_rps']:.1f} rps")
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    # Движок и пул хеширования создаются при импорте, поэтому настройки задаются до импорта app
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("DB_PROFILE", "benchmark")
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    from app.database import Base, engine
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    results = await run_burst(app, args)
+    await engine.dispose()
+
+    results["meta"] = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "database": engine.url.render_as_string(hide_password=True),
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+    }
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# test_bulk_import.py
+
+import pytest
+
+from app import bulk_import
+from app.bulk_import import ImportReport
+
+
+async def chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def parse(entity: str, data: bytes, import_format: str = "csv", size: int = 7):
+    report = ImportReport(entity)
+    lines = bulk_import._lines(chunks(data, size))
+    rows = bulk_import._csv_rows(lines) if import_format == "csv" else bulk_import._ndjson_rows(lines)
+    records = [record async for record in bulk_import._records(entity, rows, report)]
+    return records, report
+
+
+# Тест: строки CSV собираются из фрагментов произвольной длины, поля в кавычках могут содержать переводы строк
+@pytest.mark.asyncio
+async def test_csv_records_across_chunks():
+    data = ('﻿name,description,price,category\r\n"Widget, big","two\nlines",10,Books\r\n'
+            'Ball,,5.5,Toys\n\nКнига,"с ""кавычками""",1,Books').encode()
+    records, report = await parse("products", data)
+    assert records == [(2, "Widget, big", "two\nlines", 10.0, "Books"),
+                       (4, "Ball", None, 5.5, "Toys"),
+                       (6, "Книга", 'с "кавычками"', 1.0, "Books")]
+    assert report.rejected == 0
+
+
+# Тест: неверные строки отклоняются с номером строки и причиной, остальные загружаются
+@pytest.mark.asyncio
+async def test_csv_rejected_rows():
+    data = b'name,price,category\nA,-1,Books\nB,abc,Books\n,1,Books\nC,1\nD,2,Toys\nE,3,"Toys\n'
+    records, report = await parse("products", data)
+    assert records == [(6, "D", None, 2.0, "Toys")]
+    assert report.as_dict()["errors"] == [
+        {"line": 2, "detail": "Invalid price"},
+        {"line": 3, "detail": "Invalid price"},
+        {"line": 4, "detail": "Missing field 'name'"},
+        {"line": 5, "detail": "Wrong number of fields"},
+        {"line": 7, "detail": "Unterminated quoted field"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows():
+    data = b'{"username": "a", "password": "p"}\n\nnot json\n[1]\n{"username": "b"}\n{"username": "c", "password": 1}'
+    records, report = await parse("customers", data, "ndjson", size=5)
+    assert records == [(1, "a", "p"), (6, "c", "1")]
+    assert report.as_dict()["errors"] == [
+        {"line": 3, "detail": "Invalid JSON"},
+        {"line": 4, "detail": "Invalid JSON"},
+        {"line": 5, "detail": "Missing field 'password'"},
+    ]
+
+
+# Тест: хешируются только пароли новых и изменённых покупателей, уже хешированные значения сохраняются как есть
+@pytest.mark.asyncio
+async def test_customer_passwords_changed(monkeypatch):
+    async def fake_hash(password):
+        return f"$argon2id$fake${password}"
+
+    async def fake_verify(password_hash, password):
+        return password_hash == await fake_hash(password)
+
+    monkeypatch.setattr(bulk_import.passwords, "hash", fake_hash)
+    monkeypatch.setattr(bulk_import.passwords, "verify", fake_verify)
+
+    rows = [
+        ("new", "secret", None),
+        ("same", "secret", "$argon2id$fake$secret"),
+        ("changed", "other", "$argon2id$fake$secret"),
+        ("hashed", "$argon2id$kept", "$argon2id$fake$secret"),
+        ("same_hash", "$argon2id$kept", "$argon2id$kept"),
+    ]
+    assert await bulk_import._changed_passwords(rows) == [
+        ("new", "$argon2id$fake$secret"),
+        ("changed", "$argon2id$fake$other"),
+        ("hashed", "$argon2id$kept"),
+    ]
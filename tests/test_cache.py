@@ -0,0 +1,94 @@
+# test_cache.py
+
+import pytest
+
+from app.cache import Cache, MemoryBackend, RedisBackend
+
+
+# Локальная замена клиента redis.asyncio (без сервера Redis)
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+
+    # Скрипты RedisBackend выполняются их аналогами на Python
+    async def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == RedisBackend.INCR_VERSIONS_SCRIPT:
+            for key in keys:
+                await self.incr(key)
+        elif script == RedisBackend.SET_IF_VERSION_SCRIPT:
+            if int(self.data.get(keys[1], 0)) == int(argv[1]):
+                await self.set(keys[0], argv[0], ex=argv[2])
+        else:
+            raise NotImplementedError(script)
+
+
+# Тест: при переполнении вытесняется запись, к которой дольше всего не обращались
+@pytest.mark.asyncio
+async def test_memory_backend_lru():
+    backend = MemoryBackend(max_size=2, ttl=60)
+    await backend.set("a", 1)
+    await backend.set("b", 2)
+    await backend.get("a")
+    await backend.set("c", 3)
+
+    assert await backend.get("a") == 1
+    assert await backend.get("b") is None
+    assert await backend.get("c") == 3
+
+
+# Тест: просроченная запись не возвращается
+@pytest.mark.asyncio
+async def test_memory_backend_ttl():
+    backend = MemoryBackend(max_size=10, ttl=-1)
+    await backend.set("a", 1)
+
+    assert await backend.get("a") is None
+
+
+# Тест: счётчики попаданий и промахов, сброс ключа и списков пространства имён
+@pytest.mark.parametrize("backend", [MemoryBackend(), RedisBackend(FakeRedis())])
+@pytest.mark.asyncio
+async def test_cache_invalidate(backend):
+    cache = Cache(backend)
+    list_key = await cache.list_key("products", 0, 100)
+    await cache.set("product:1", {"id": 1})
+    await cache.set(list_key, [{"id": 1}])
+
+    assert await cache.get("product:1") == {"id": 1}
+    assert await cache.get(list_key) == [{"id": 1}]
+
+    await cache.invalidate("products", "product:1")
+
+    assert await cache.get("product:1") is None
+    assert await cache.get(await cache.list_key("products", 0, 100)) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+# Тест: значение, прочитанное до сброса ключа, не сохраняется после сброса
+@pytest.mark.parametrize("backend", [MemoryBackend(), RedisBackend(FakeRedis())])
+@pytest.mark.asyncio
+async def test_cache_set_after_invalidate(backend):
+    cache = Cache(backend)
+    generation = await cache.generation("product:1")
+    await cache.invalidate("products", "product:1")
+    await cache.set("product:1", {"id": 1, "name": "old"}, generation)
+
+    assert await cache.get("product:1") is None
+
+    await cache.set("product:1", {"id": 1, "name": "new"}, await cache.generation("product:1"))
+
+    assert await cache.get("product:1") == {"id": 1, "name": "new"}
@@ -0,0 +1,63 @@
+# test_config.py
+
+import pytest
+
+from app.config import PROFILES, IngestSettings, get_profile_name, load_engine_settings, load_ingest_settings
+
+
+# Тест: параметры профиля переопределяются переменными окружения DB_<ПАРАМЕТР>
+def test_profile_overrides(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "40")
+    monkeypatch.setenv("DB_ECHO", "true")
+    settings = load_engine_settings("prod")
+
+    assert settings.pool_size == 40
+    assert settings.echo is True
+    assert settings.pool_pre_ping == PROFILES["prod"].pool_pre_ping
+
+
+# Тест: без DB_PROFILE выбирается профиль prod без вывода SQL в лог, dev включается только явно
+def test_default_profile(monkeypatch):
+    monkeypatch.delenv("DB_PROFILE", raising=False)
+    monkeypatch.delenv("DB_ECHO", raising=False)
+
+    assert get_profile_name() == "prod"
+    assert load_engine_settings().echo is False
+
+    monkeypatch.setenv("DB_PROFILE", "dev")
+    assert load_engine_settings().echo is True
+
+
+# Тест: неизвестный профиль приводит к ошибке
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        load_engine_settings("staging")
+
+
+# Тест: параметры очереди приёма заказов переопределяются переменными ORDER_INGEST_<ПАРАМЕТР>
+def test_ingest_overrides(monkeypatch):
+    monkeypatch.setenv("ORDER_INGEST_BATCH_SIZE", "1000")
+    monkeypatch.setenv("ORDER_INGEST_FLUSH_INTERVAL", "0.2")
+    settings = load_ingest_settings()
+
+    assert settings.batch_size == 1000
+    assert settings.flush_interval == 0.2
+    assert settings.queue_size == IngestSettings().queue_size
+
+
+# Тест: число прогреваемых соединений задаётся профилем и переопределяется DB_WARMUP_CONNECTIONS
+def test_warmup_connections(monkeypatch):
+    assert load_engine_settings("dev").warmup_connections == 0
+    assert load_engine_settings("prod").warmup_connections == PROFILES["prod"].warmup_connections > 0
+
+    monkeypatch.setenv("DB_WARMUP_CONNECTIONS", "5")
+    assert load_engine_settings("prod").warmup_connections == 5
+
+
+# Тест: режим сессий задаётся профилем и переопределяется DB_SESSION_MODE
+def test_session_mode(monkeypatch):
+    assert load_engine_settings("dev").session_mode == "request"
+    assert load_engine_settings("prod").session_mode == "release"
+
+    monkeypatch.setenv("DB_SESSION_MODE", "request")
+    assert load_engine_settings("prod").session_mode == "request"
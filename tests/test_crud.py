@@ -0,0 +1,111 @@
+# test_crud.py
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import crud, models, schemas
+from app.cache import Cache, MemoryBackend
+from app.database import Base
+
+
+async def create_engine():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return engine
+
+
+# Сессия с базой SQLite в памяти (нужен пакет aiosqlite): функции crud должны работать и вне PostgreSQL
+@pytest_asyncio.fixture
+async def db():
+    engine = await create_engine()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+async def add_products(db, *names):
+    category = models.Category(name="Electronics")
+    db.add(category)
+    await db.flush()
+    products = [models.Product(name=name, description="", price=100, category_id=category.id) for name in names]
+    db.add_all(products)
+    await db.commit()
+    return products
+
+
+# Тест: выборка по списку ID без массивов (id IN ...) сохраняет порядок запроса и возвращает отсутствующие ID
+@pytest.mark.asyncio
+async def test_get_products_by_ids(db):
+    phone, laptop = await add_products(db, "Phone", "Laptop")
+
+    found, missing = await crud.get_products_by_ids(db, [laptop.id, 999, phone.id, laptop.id])
+
+    assert [product.name for product in found] == ["Laptop", "Phone"]
+    assert missing == [999]
+
+
+# Тест: товар изменён между промахом кэша и записью прочитанной строки в кэш - старая строка в кэше не остаётся
+@pytest.mark.asyncio
+async def test_cached_product_updated_during_miss(db, monkeypatch):
+    monkeypatch.setattr(crud, "catalog_cache", Cache(MemoryBackend()))
+    product, = await add_products(db, "Phone")
+    update = schemas.ProductUpdate(name="Phone 2", description="", price=100, category_id=product.category_id)
+    execute = db.execute
+
+    # Изменение фиксируется сразу после того, как читатель получил старую строку
+    async def execute_then_update(statement, *args, **kwargs):
+        result = await execute(statement, *args, **kwargs)
+        monkeypatch.setattr(db, "execute", execute)
+        await crud.update_product(db, product.id, update)
+        return result
+
+    monkeypatch.setattr(db, "execute", execute_then_update)
+
+    assert (await crud.get_product(db, product.id)).name == "Phone"
+    # Следующий запрос - как из новой сессии: без объектов, загруженных до изменения
+    db.expunge_all()
+    assert (await crud.get_product(db, product.id)).name == "Phone 2"
+
+
+# Тест: при промахе кэша в сессии реплики товар читается с основной БД, отставшая строка реплики в кэш не попадает
+@pytest.mark.asyncio
+async def test_cached_product_from_primary(db, monkeypatch):
+    monkeypatch.setattr(crud, "catalog_cache", Cache(MemoryBackend()))
+    product, = await add_products(db, "Phone 2")
+    replica_engine = await create_engine()
+    try:
+        async with AsyncSession(replica_engine, expire_on_commit=False) as replica:
+            await add_products(replica, "Phone")
+
+        primary = async_sessionmaker(db.bind, expire_on_commit=False)
+        async with AsyncSession(replica_engine, info={"primary": primary}) as replica:
+            assert (await crud.get_product(replica, product.id)).name == "Phone 2"
+            assert (await crud.get_products(replica))[0].name == "Phone 2"
+    finally:
+        await replica_engine.dispose()
+
+    assert (await crud.catalog_cache.get(f"product:{product.id}"))["name"] == "Phone 2"
+
+
+# Тест: заказ из корзины с двумя товарами одной категории учитывается в сводке категории одним заказом
+@pytest.mark.asyncio
+async def test_category_sales_cart_order(db):
+    phone, laptop = await add_products(db, "Phone", "Laptop")
+    customer = models.Customer(username="buyer", password="secret")
+    db.add(customer)
+    await db.commit()
+
+    order = await crud.create_cart_order(db, schemas.OrderCartCreate(customer_id=customer.id, items=[
+        schemas.OrderItemCreate(product_id=phone.id, quantity=1),
+        schemas.OrderItemCreate(product_id=laptop.id, quantity=2),
+    ]))
+    sales, = await crud.get_category_sales(db)
+
+    assert (sales["name"], sales["orders_count"], sales["units"], sales["revenue"]) == ("Electronics", 1, 3, 300)
+
+    await crud.delete_order(db, order["id"])
+
+    assert await crud.get_category_sales(db) == []
@@ -0,0 +1,67 @@
+# test_database.py
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionReleasingRoute, get_db, get_read_db, is_read_only_route
+
+
+class ItemSchema(BaseModel):
+    name: str
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Тест: в режиме release сессия обработчика закрывается до сериализации ответа и завершения зависимости
+def test_session_releasing_route():
+    events = []
+
+    class RecordingSession(AsyncSession):
+        async def close(self):
+            events.append("close")
+            await super().close()
+
+    class Item:
+        @property
+        def name(self):
+            events.append("serialize")
+            return "item"
+
+    async def get_session():
+        async with RecordingSession() as session:
+            yield session
+        events.append("dependency exit")
+
+    app = FastAPI()
+    app.router.route_class = SessionReleasingRoute
+
+    @app.get("/item", response_model=ItemSchema)
+    async def read_item(db: AsyncSession = Depends(get_session)):
+        events.append("handler")
+        return Item()
+
+    response = TestClient(app).get("/item")
+
+    assert response.json() == {"name": "item"}
+    assert events[:3] == ["handler", "close", "serialize"]
+    assert events[-1] == "dependency exit"
+
+
+# Тест: маршрут с сессией для чтения считается маршрутом только на чтение независимо от метода
+def test_is_read_only_route():
+    app = FastAPI()
+
+    @app.post("/items/batch")
+    async def read_items(db: AsyncSession = Depends(get_read_db)):
+        return []
+
+    @app.post("/items")
+    async def create_item(db: AsyncSession = Depends(get_db)):
+        return {}
+
+    routes = {route.path: route for route in app.routes}
+    assert is_read_only_route(routes["/items/batch"])
+    assert not is_read_only_route(routes["/items"])
+    assert not is_read_only_route(None)
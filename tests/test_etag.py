@@ -0,0 +1,55 @@
+# test_etag.py
+
+from datetime import datetime, timezone
+
+from starlette.requests import Request
+
+from app.etag import is_not_modified, list_etag, not_modified, resource_etag
+
+
+class Item:
+    def __init__(self, id, version, updated_at):
+        self.id = id
+        self.version = version
+        self.updated_at = updated_at
+
+
+def make_request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+NOW = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+
+
+# Тест: ETag записи зависит от версии, наивное время считается UTC
+def test_resource_etag():
+    assert resource_etag(Item(1, 1, NOW)) == resource_etag(Item(1, 1, NOW.replace(tzinfo=None)))
+    assert resource_etag(Item(1, 1, NOW)) != resource_etag(Item(1, 2, NOW))
+
+
+# Тест: ETag списка меняется при изменении версии любой записи или курсора
+def test_list_etag():
+    items = [Item(1, 1, NOW), Item(2, 1, NOW)]
+    assert list_etag(items, None) == list_etag(list(items), None)
+    assert list_etag(items, None) != list_etag([Item(1, 1, NOW), Item(2, 2, NOW)], None)
+    assert list_etag(items, None) != list_etag(items, "cursor")
+
+
+# Тест: If-None-Match сравнивается слабым сравнением и поддерживает список и '*'
+def test_if_none_match():
+    etag = resource_etag(Item(1, 1, NOW))
+    assert not is_not_modified(make_request(), etag)
+    assert is_not_modified(make_request(etag), etag)
+    assert is_not_modified(make_request(f'"other", W/{etag}'), etag)
+    assert is_not_modified(make_request("*"), etag)
+    assert not is_not_modified(make_request('"other"'), etag)
+
+
+# Тест: ответ 304 без тела содержит ETag и Last-Modified
+def test_not_modified():
+    response = not_modified('"1-a"', NOW)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"1-a"'
+    assert response.headers["last-modified"] == "Tue, 02 Jan 2024 03:04:05 GMT"
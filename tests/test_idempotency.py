@@ -0,0 +1,34 @@
+# test_idempotency.py
+
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.idempotency import replay_response, request_fingerprint
+from app.schemas import OrderCreate
+
+
+# Тест: отпечаток не зависит от порядка полей в JSON клиента, но зависит от маршрута и значений
+def test_request_fingerprint():
+    order = OrderCreate.model_validate_json('{"customer_id": 1, "product_id": 2, "quantity": 3}')
+    same = OrderCreate.model_validate_json('{"quantity": 3, "product_id": 2, "customer_id": 1}')
+    other = OrderCreate(customer_id=1, product_id=2, quantity=4)
+    assert request_fingerprint("POST /orders/", order) == request_fingerprint("POST /orders/", same)
+    assert request_fingerprint("POST /orders/", order) != request_fingerprint("POST /orders/", other)
+    assert request_fingerprint("POST /orders/", order) != request_fingerprint("POST /orders/cart", order)
+
+
+# Тест: повтор возвращает сохранённый ответ с заголовком Idempotent-Replayed
+def test_replay_response():
+    response = replay_response({"fingerprint": "abc", "response": {"id": 1}}, "abc")
+    assert response.status_code == 200
+    assert response.headers["idempotent-replayed"] == "true"
+    assert json.loads(response.body) == {"id": 1}
+
+
+# Тест: ключ, использованный для другого запроса, отклоняется
+def test_replay_response_fingerprint_mismatch():
+    with pytest.raises(HTTPException) as error:
+        replay_response({"fingerprint": "abc", "response": {"id": 1}}, "def")
+    assert error.value.status_code == 422
@@ -0,0 +1,56 @@
+# test_ingest.py
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app import crud
+from app.config import IngestSettings
+from app.ingest import OrderIngestQueue
+from app.schemas import OrderCreate
+
+
+@asynccontextmanager
+async def fake_session():
+    yield None
+
+
+def make_queue(monkeypatch, batches, **settings):
+    # Вместо записи в БД запоминаем размеры пакетов; заказы с quantity > 10 "не создаются"
+    async def create_orders_bulk(db, orders):
+        batches.append(len(orders))
+        return [{"index": index, "order": dict(order.model_dump(), id=index, total_price=1.0)} if order.quantity <= 10
+                else {"index": index, "detail": "Insufficient stock"} for index, order in enumerate(orders)]
+
+    monkeypatch.setattr(crud, "create_orders_bulk", create_orders_bulk)
+    return OrderIngestQueue(IngestSettings(**settings), sessionmaker=fake_session)
+
+
+# Тест: заказы записываются пакетами не больше batch_size, статусы доступны по номеру
+@pytest.mark.asyncio
+async def test_batches_and_statuses(monkeypatch):
+    batches = []
+    queue = make_queue(monkeypatch, batches, batch_size=4, flush_interval=0.01, workers=1)
+    accepted = [await queue.submit(OrderCreate(customer_id=1, product_id=1, quantity=quantity))
+                for quantity in (1, 2, 3, 4, 5, 50)]
+    assert all(status["status"] == "queued" for status in accepted)
+
+    await queue.close()
+    assert batches == [4, 2]
+    statuses = [await queue.status(status["tracking_id"]) for status in accepted]
+    assert [status["status"] for status in statuses] == ["created"] * 5 + ["failed"]
+    assert statuses[0]["order"]["quantity"] == 1
+    assert statuses[-1]["detail"] == "Insufficient stock"
+    assert queue.stats()["orders"] == 5
+
+
+# Тест: заполненная очередь отклоняет новые заказы
+@pytest.mark.asyncio
+async def test_queue_full(monkeypatch):
+    queue = make_queue(monkeypatch, [], queue_size=2, workers=1)
+    await queue.submit(OrderCreate(customer_id=1, product_id=1, quantity=1))
+    await queue.submit(OrderCreate(customer_id=1, product_id=1, quantity=1))
+    with pytest.raises(asyncio.QueueFull):
+        await queue.submit(OrderCreate(customer_id=1, product_id=1, quantity=1))
+    await queue.close()
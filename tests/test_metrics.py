@@ -0,0 +1,45 @@
+# test_metrics.py
+
+from app.metrics import Histogram, MetricsRegistry, RequestMetrics, current_request_metrics
+
+
+# Тест: бакеты гистограммы накопительные, граничное значение попадает в свой бакет
+def test_histogram_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [(0.1, 2), (1.0, 3), ("+Inf", 4)]
+    assert histogram.count == 4
+
+
+# Тест: SQL-запросы относятся к текущему HTTP-запросу и попадают в вывод /metrics
+def test_registry_render():
+    registry = MetricsRegistry()
+    request_metrics = RequestMetrics()
+    token = current_request_metrics.set(request_metrics)
+    registry.observe_query(0.002)
+    registry.observe_query(0.003)
+    current_request_metrics.reset(token)
+    registry.observe_request("GET", "/products/{product_id}", 200, 0.01, request_metrics)
+
+    text = registry.render()
+    assert request_metrics.queries == 2
+    assert 'http_requests_total{method="GET",route="/products/{product_id}",status="200"} 1' in text
+    assert 'http_request_db_queries_bucket{method="GET",route="/products/{product_id}",le="2"} 1' in text
+    assert "db_queries_total 2" in text
+
+
+# Тест: время удержания соединения учитывается в общей гистограмме и в счётчиках HTTP-запроса
+def test_connection_hold():
+    registry = MetricsRegistry()
+    request_metrics = RequestMetrics()
+    registry.observe_connection_hold(0.02, request_metrics)
+    registry.observe_connection_hold(0.5)
+    registry.observe_request("GET", "/orders/{order_id}", 200, 0.03, request_metrics)
+
+    text = registry.render()
+    assert request_metrics.connection_time == 0.02
+    assert 'db_connection_hold_seconds_bucket{le="0.025"} 1' in text
+    assert "db_connection_hold_seconds_count 2" in text
+    assert 'http_request_db_connection_seconds_bucket{method="GET",route="/orders/{order_id}",le="0.025"} 1' in text
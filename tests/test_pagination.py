@@ -0,0 +1,66 @@
+# test_pagination.py
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, decode_sort_cursor, encode_cursor, make_page
+
+
+class Row:
+    def __init__(self, id):
+        self.id = id
+
+
+# Тест: курсор декодируется обратно в тот же id
+def test_cursor_roundtrip():
+    assert decode_cursor(encode_cursor(42)) == 42
+
+
+# Тест: пустой курсор означает первую страницу
+def test_empty_cursor():
+    assert decode_cursor("") is None
+
+
+# Тест: некорректный курсор приводит к ошибке 400
+def test_invalid_cursor():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+# Тест: курсор на следующую страницу выдаётся только при наличии лишней записи
+def test_make_page():
+    page = make_page([Row(1), Row(2), Row(3)], limit=2)
+    assert [row.id for row in page["items"]] == [1, 2]
+    assert decode_cursor(page["next_cursor"]) == 2
+
+    page = make_page([Row(1), Row(2)], limit=2)
+    assert page["next_cursor"] is None
+
+
+class PricedRow(Row):
+    def __init__(self, id, price):
+        super().__init__(id)
+        self.price = price
+
+
+# Тест: при сортировке по полю курсор хранит значение поля и id последней записи
+def test_sort_cursor_roundtrip():
+    page = make_page([PricedRow(7, 9.5), PricedRow(3, 10.0), PricedRow(5, 12.0)], limit=2, sort="-price")
+    assert decode_sort_cursor(page["next_cursor"], "-price") == (10.0, 3)
+
+
+# Тест: курсор сортировки по id совместим с обычным курсором
+def test_sort_cursor_by_id():
+    assert decode_sort_cursor(encode_cursor(42), "id") == (42, 42)
+    assert decode_sort_cursor("", "price") is None
+
+
+# Тест: курсор, выданный для другой сортировки, приводит к ошибке 400
+def test_sort_cursor_mismatch():
+    cursor = encode_cursor(3, "price", 10.0)
+    with pytest.raises(HTTPException) as exc:
+        decode_sort_cursor(cursor, "name")
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        decode_sort_cursor(encode_cursor(42), "price")
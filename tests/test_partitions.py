@@ -0,0 +1,94 @@
+# test_partitions.py
+
+from datetime import date
+
+import pytest
+
+from app.partitions import add_months, create_order_partitions, partition_name
+
+
+class FakeSession:
+    def __init__(self, existing, default_rows=(), failing=()):
+        self.existing = set(existing)
+        self.default_rows = set(default_rows)
+        self.failing = set(failing)
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    # to_regclass(:name) - существует ли секция, EXISTS (...) - есть ли строки месяца в секции по умолчанию
+    async def scalar(self, statement, params=None):
+        if params is not None:
+            return params["name"] if params["name"] in self.existing else None
+        return any(f"'{month}-01 00:00:00+00'" in str(statement) for month in self.default_rows)
+
+    async def execute(self, statement):
+        if any(f"TABLE IF NOT EXISTS {name} " in str(statement) for name in self.failing):
+            raise RuntimeError("partition failed")
+        self.statements.append(str(statement))
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+def creates(db):
+    return [statement for statement in db.statements if statement.startswith("CREATE TABLE IF NOT EXISTS")]
+
+
+def test_add_months():
+    assert add_months(date(2026, 11, 1), 1) == date(2026, 12, 1)
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2026, 3, 1), -14) == date(2025, 1, 1)
+    assert partition_name(date(2026, 3, 1)) == "orders_y2026m03"
+
+
+# Тест: создаются только недостающие секции, границы - начало месяца и начало следующего по UTC
+@pytest.mark.asyncio
+async def test_create_missing_partitions():
+    db = FakeSession(existing={"orders_y2026m12"})
+    created = await create_order_partitions(db, months_ahead=2, today=date(2026, 11, 18))
+
+    assert created == ["orders_y2026m11", "orders_y2027m01"]
+    assert creates(db) == [
+        "CREATE TABLE IF NOT EXISTS orders_y2026m11 PARTITION OF orders "
+        "FOR VALUES FROM ('2026-11-01 00:00:00+00') TO ('2026-12-01 00:00:00+00')",
+        "CREATE TABLE IF NOT EXISTS orders_y2027m01 PARTITION OF orders "
+        "FOR VALUES FROM ('2027-01-01 00:00:00+00') TO ('2027-02-01 00:00:00+00')",
+    ]
+    assert not any(statement.startswith("DELETE") for statement in db.statements)
+    assert db.commits == 2
+
+
+# Тест: заказы месяца, попавшие в секцию по умолчанию, переносятся в созданную секцию вместе с позициями
+@pytest.mark.asyncio
+async def test_move_default_rows():
+    db = FakeSession(existing=set(), default_rows={"2026-11"})
+    created = await create_order_partitions(db, months_ahead=1, today=date(2026, 11, 18))
+
+    assert created == ["orders_y2026m11", "orders_y2026m12"]
+    assert [" ".join(statement.split()[:3]) for statement in db.statements] == [
+        "LOCK TABLE orders",
+        "CREATE TEMP TABLE",
+        "CREATE TEMP TABLE",
+        "DELETE FROM orders_default",
+        "CREATE TABLE IF",
+        "INSERT INTO orders",
+        "INSERT INTO order_items",
+        "LOCK TABLE orders",
+        "CREATE TABLE IF",
+    ]
+    assert db.commits == 2
+
+
+# Тест: ошибка создания секции одного месяца не отменяет секции остальных месяцев
+@pytest.mark.asyncio
+async def test_partition_error_isolated():
+    db = FakeSession(existing=set(), failing={"orders_y2026m11"})
+    created = await create_order_partitions(db, months_ahead=2, today=date(2026, 11, 18))
+
+    assert created == ["orders_y2026m12", "orders_y2027m01"]
+    assert (db.commits, db.rollbacks) == (2, 1)
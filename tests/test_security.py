@@ -0,0 +1,59 @@
+# test_security.py
+
+import asyncio
+
+import pytest
+from argon2 import PasswordHasher
+
+from app.security import PasswordHasherPool, is_password_hash
+
+FAST = dict(time_cost=1, memory_cost=8, parallelism=1)
+
+
+# Тест: хеш проверяется в пуле потоков, неверный пароль отклоняется
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    pool = PasswordHasherPool(PasswordHasher(**FAST), max_workers=2)
+    password_hash = await pool.hash("secret")
+    assert is_password_hash(password_hash)
+    assert await pool.verify(password_hash, "secret")
+    assert not await pool.verify(password_hash, "wrong")
+    assert not await pool.verify(None, "secret")
+
+
+# Тест: пароли, сохранённые без хеширования, проверяются и требуют пересчёта
+@pytest.mark.asyncio
+async def test_legacy_plaintext():
+    pool = PasswordHasherPool(PasswordHasher(**FAST), max_workers=0)
+    assert await pool.verify("secret", "secret")
+    assert not await pool.verify("secret", "wrong")
+    assert pool.needs_rehash("secret")
+
+
+# Тест: хеш с другими параметрами Argon2 требует пересчёта
+@pytest.mark.asyncio
+async def test_needs_rehash_on_parameter_change():
+    old = PasswordHasherPool(PasswordHasher(**FAST), max_workers=1)
+    new = PasswordHasherPool(PasswordHasher(time_cost=2, memory_cost=8, parallelism=1), max_workers=1)
+    password_hash = await old.hash("secret")
+    assert not old.needs_rehash(password_hash)
+    assert new.needs_rehash(password_hash)
+    assert await new.verify(password_hash, "secret")
+
+
+# Тест: одновременно выполняется не больше max_workers вычислений
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    pool = PasswordHasherPool(PasswordHasher(**FAST), max_workers=2)
+    running = 0
+    peak = 0
+
+    def work():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        PasswordHasher(**FAST).hash("x")
+        running -= 1
+
+    await asyncio.gather(*(pool._run(work) for _ in range(10)))
+    assert peak <= 2
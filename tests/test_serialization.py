@@ -0,0 +1,35 @@
+# test_serialization.py
+
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from app import schemas
+from app.pagination import make_page
+from app.serialization import fast_response, get_adapter
+
+OrderRow = namedtuple("OrderRow", "id customer_id product_id quantity total_price created_at")
+CustomerRow = namedtuple("CustomerRow", "id username password")
+
+
+# Тест: строки БД сериализуются по схеме ответа через атрибуты
+def test_fast_response_rows():
+    created_at = datetime(2026, 10, 1, 12, 30, tzinfo=timezone.utc)
+    response = fast_response(list[schemas.Order], [OrderRow(1, 2, 3, 4, 40.0, created_at)])
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == [
+        {"id": 1, "customer_id": 2, "product_id": 3, "quantity": 4, "total_price": 40.0,
+         "created_at": "2026-10-01T12:30:00Z"}]
+
+
+# Тест: поля, которых нет в схеме (пароль), в ответ не попадают; страница с курсором сериализуется целиком
+def test_fast_response_page():
+    page = make_page([CustomerRow(1, "a", "x"), CustomerRow(2, "b", "y")], limit=1)
+    data = json.loads(fast_response(schemas.Page[schemas.Customer], page).body)
+    assert data["items"] == [{"username": "a"}]
+    assert data["next_cursor"] is not None
+
+
+# Тест: TypeAdapter создаётся один раз на тип ответа
+def test_adapter_cached():
+    assert get_adapter(list[schemas.Order]) is get_adapter(list[schemas.Order])